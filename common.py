@@ -9,11 +9,32 @@
 """
 
 # ==================== 导入模块 ====================
-import json                             # JSON序列化，用于网络消息
-from typing import List, Tuple, Optional # 类型提示
-from dataclasses import dataclass, field # 数据类装饰器，简化类定义
+import json                             # JSON序列化，用于调试时查看消息
+import os                               # 路径拼接，用于本机套接字文件
+import stat                             # 文件类型和权限位，用于检查本机套接字目录
+import tempfile                         # 系统临时目录，用于本机套接字文件
+import random                           # 随机数，用于生成Zobrist哈希表
+import struct                           # 二进制打包，用于网络消息编码
+from array import array                 # 紧凑的整数数组，用于批量状态
+from functools import reduce            # 归约函数，用于异或出初始哈希
+from operator import xor                # 异或运算符函数
+from typing import List, Tuple, Optional, Dict # 类型提示
+from dataclasses import dataclass       # 数据类装饰器，简化类定义
 from enum import Enum                    # 枚举类型
 
+# orjson是可选依赖：装了就用它（编码/解码快几倍），没装就退回标准库json
+try:
+    import orjson
+    
+    def _json_dumps(obj) -> str:
+        # orjson.dumps返回bytes，这里转成str与json.dumps保持一致
+        return orjson.dumps(obj).decode('utf-8')
+    
+    _json_loads = orjson.loads
+except ImportError:
+    _json_dumps = json.dumps
+    _json_loads = json.loads
+
 
 # ==================== 常量定义 ====================
 
@@ -23,6 +44,37 @@ DEFAULT_PORT = 9527
 # 网络缓冲区大小（字节）
 BUFFER_SIZE = 4096
 
+# 这些地址表示Solver和UI在同一台机器上，此时优先走Unix域套接字：
+# 不经过TCP协议栈（没有校验和、Nagle算法和回环路由），延迟更低
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+def unix_socket_path(port: int) -> str:
+    """
+    UI在本机监听的Unix域套接字路径（按端口区分，同一台机器上可以开多个UI）
+    
+    套接字放在只有当前用户能访问的目录里（$XDG_RUNTIME_DIR，没有时在临时目录下
+    建一个权限0700的子目录）。直接放在公共的/tmp里的话，别的用户可以抢先
+    建好同名的套接字，冒充UI接收Solver的连接
+    
+    参数:
+        port: UI的TCP端口号
+    
+    返回值:
+        套接字文件的路径；目录不属于当前用户或别人也能访问时抛出OSError，
+        调用方改用TCP
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), f"puzzle_ui-{os.getuid()}")
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    
+    # lstat不跟随符号链接：别人预先放一个指向自己目录的链接也会被拒绝
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError(f"套接字目录不安全: {directory}")
+    return os.path.join(directory, f"puzzle_ui_{port}.sock")
+
 
 # ==================== 方向枚举 ====================
 
@@ -57,51 +109,294 @@ OPPOSITE_DIRECTION = {
 }
 
 
+# ==================== 整数方向编码 ====================
+
+# 搜索内层循环用0~3的小整数表示方向，直接按下标查元组，
+# 省去以Enum对象为键的字典查找；Direction只在对外接口（网络消息、UI）上使用
+DIR_UP, DIR_DOWN, DIR_LEFT, DIR_RIGHT = 0, 1, 2, 3
+
+# 方向编号 -> (行偏移, 列偏移)，顺序与DIRECTION_DELTA一致
+DELTA = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+# 方向编号 -> 反方向编号
+# 编号的排列保证互为反方向的两个编号只差最低位，所以反方向就是 code ^ 1，
+# 热点路径可以直接做异或而不查表
+OPPOSITE = tuple(code ^ 1 for code in range(4))
+
+# 方向编号 <-> Direction 的互相转换（只在边界上转换一次）
+CODE_TO_DIRECTION = (Direction.UP, Direction.DOWN, Direction.LEFT, Direction.RIGHT)
+DIRECTION_TO_CODE = {direction: code for code, direction in enumerate(CODE_TO_DIRECTION)}
+
+
 # ==================== 棋盘状态类 ====================
 
-@dataclass
+# 以下查找表都以棋盘大小为键，首次创建某个大小的PuzzleState时构建
+# 棋盘按行展开成一维，下标 idx = 行号 * size + 列号
+
+# NEIGHBORS[size][idx] -> ((方向编号, 移动后空位下标), ...)
+NEIGHBORS: Dict[int, List[Tuple[Tuple[int, int], ...]]] = {}
+
+# _VALID_MOVES_CACHE[size][idx] -> (方向, ...)，即空位在idx时的有效移动
+_VALID_MOVES_CACHE: Dict[int, List[Tuple[Direction, ...]]] = {}
+
+# _VALID_CODES_CACHE[size][idx] -> (方向编号, ...)，同上，供求解器使用
+_VALID_CODES_CACHE: Dict[int, List[Tuple[int, ...]]] = {}
+
+# NEIGHBOR_IDX[size][idx][方向编号] -> 移动后空位下标，无效方向为-1
+NEIGHBOR_IDX: Dict[int, List[Tuple[int, int, int, int]]] = {}
+
+# NEXT_CODES[size][idx][last] -> 上一步方向编号为last时，空位在idx可以尝试的方向编号
+# 已经去掉了走回头路的方向（last的反方向）；last取NO_LAST_MOVE(4)表示没有上一步
+# 搜索时一次二维查表就得到要遍历的方向，循环里不需要任何判断
+NEXT_CODES: Dict[int, List[Tuple[Tuple[int, ...], ...]]] = {}
+NO_LAST_MOVE = 4
+
+# ZOBRIST[size][idx][value] -> 64位随机数
+# 棋盘的哈希值 = 每个格子 ZOBRIST[size][idx][棋盘[idx]] 的异或
+# 移动一步只改变两个格子，哈希值可以用4次异或增量更新
+ZOBRIST: Dict[int, List[List[int]]] = {}
+
+# 固定随机种子，保证不同进程（UI和Solver）算出的哈希一致
+ZOBRIST_SEED = 20240527
+
+# GOAL_BYTES[size] -> 目标状态的一维字节串 1,2,...,n²-1,0
+GOAL_BYTES: Dict[int, bytes] = {}
+
+# ROW_FORMAT[size] -> 打印一行用的格式串，例如3x3为 '{:>1} {:>1} {:>1}'
+ROW_FORMAT: Dict[int, str] = {}
+
+
+def _build_tables(size: int):
+    """
+    构建指定大小棋盘的所有移动查找表
+    
+    参数:
+        size: 棋盘大小
+    """
+    neighbors = []
+    valid_moves = []
+    valid_codes = []
+    neighbor_idx = []
+    
+    for idx in range(size * size):
+        r, c = divmod(idx, size)
+        entries = []
+        targets = [-1, -1, -1, -1]
+        # 按 上、下、左、右 的顺序，与原来的get_valid_moves保持一致
+        for code, (dr, dc) in enumerate(DELTA):
+            new_r, new_c = r + dr, c + dc
+            if 0 <= new_r < size and 0 <= new_c < size:
+                entries.append((code, new_r * size + new_c))
+                targets[code] = new_r * size + new_c
+        
+        neighbors.append(tuple(entries))
+        valid_codes.append(tuple(code for code, _ in entries))
+        valid_moves.append(tuple(CODE_TO_DIRECTION[code] for code, _ in entries))
+        neighbor_idx.append(tuple(targets))
+    
+    # 全部先在局部变量里建好再发布：预热线程和主线程可能同时构建同一个大小，
+    # 调用方只看NEIGHBOR_IDX里有没有size，所以它最后赋值，
+    # 别的线程看到它时其余的表都已就绪（两个线程建出的表完全相同，谁覆盖谁都一样）
+    next_codes = [
+        tuple(tuple(code for code in codes if last == NO_LAST_MOVE or code != last ^ 1)
+              for last in range(NO_LAST_MOVE + 1))
+        for codes in valid_codes
+    ]
+    # 按最宽数字的宽度右对齐
+    cell_width = len(str(size * size - 1))
+    
+    # 每个(位置, 数字)组合分配一个64位随机数
+    rng = random.Random(ZOBRIST_SEED + size)
+    zobrist = [
+        [rng.getrandbits(64) for _ in range(size * size)]
+        for _ in range(size * size)
+    ]
+    
+    NEIGHBORS[size] = neighbors
+    _VALID_MOVES_CACHE[size] = valid_moves
+    _VALID_CODES_CACHE[size] = valid_codes
+    NEXT_CODES[size] = next_codes
+    GOAL_BYTES[size] = bytes(range(1, size * size)) + b'\x00'
+    ROW_FORMAT[size] = ' '.join(['{:>%d}' % cell_width] * size)
+    ZOBRIST[size] = zobrist
+    NEIGHBOR_IDX[size] = neighbor_idx
+
+
+def move_flat(buf: bytearray, size: int, blank_idx: int, code: int) -> int:
+    """
+    在一维棋盘上直接移动空位（底层函数，不经过PuzzleState）
+    
+    供求解器在搜索内层循环中使用，省去对象属性访问和哈希维护的开销
+    需要先创建过同样大小的PuzzleState（保证查找表已构建）
+    
+    参数:
+        buf: 一维棋盘，原地修改
+        size: 棋盘大小
+        blank_idx: 当前空位下标
+        code: 方向编号（DIR_UP/DIR_DOWN/DIR_LEFT/DIR_RIGHT）
+    
+    返回值:
+        移动后的空位下标，-1表示无效移动（此时buf不变）
+    """
+    new_idx = NEIGHBOR_IDX[size][blank_idx][code]
+    if new_idx < 0:
+        return -1
+    
+    # 交换空位和目标位置的值
+    buf[blank_idx] = buf[new_idx]  # 数字移到空位
+    buf[new_idx] = 0               # 新位置变成空位
+    return new_idx
+
+
+@dataclass(init=False, eq=False, repr=False)
 class PuzzleState:
     """
     数字华容道棋盘状态类
     
-    使用@dataclass装饰器可以自动生成__init__、__repr__等方法
+    棋盘在内部按行展开成一维bytearray存储（每格一个字节，支持到15x15），
+    哈希、比较、拷贝都直接作用在这块连续内存上
+    
+    构造函数、__eq__、__repr__都是手写的，@dataclass只用来声明字段，
+    不再生成逐字段比较的__eq__和逐字段拼接的__repr__；
+    并且用__slots__去掉每个实例的__dict__（状态对象会大量放进visited集合）
     
     属性:
-        board: 二维列表，存储棋盘数字，0表示空位
         size: 棋盘大小（自动计算）
-        blank_pos: 空位位置（自动计算）
+        blank_idx: 空位在一维数组中的下标（自动计算）
+        board: 二维列表视图（只读属性，按需重建）
+        blank_pos: 空位的(行, 列)（只读属性）
     """
-    # 棋盘二维数组，0表示空位
-    # 例如 3x3 棋盘: [[1,2,3], [4,5,6], [7,8,0]]
-    board: List[List[int]]
+    # 棋盘大小
+    size: int
+    
+    # 空位下标，等于 行号 * size + 列号
+    blank_idx: int
+    
+    # 一维棋盘，0表示空位
+    # 例如 3x3 棋盘 [[1,2,3], [4,5,6], [7,8,0]] 存为 bytearray(b'\x01\x02...\x00')
+    _buf: bytearray
+    
+    # 缓存的哈希键（bytes(_buf)），只在move时失效
+    _hash_key: Optional[bytes]
+    
+    # Zobrist哈希值，在move中增量更新
+    _zhash: int
+    
+    # 字段都在__init__/_from_buf中赋值，所以不设默认值（默认值会和__slots__冲突）
+    __slots__ = ('size', 'blank_idx', '_buf', '_hash_key', '_zhash')
+    
+    def __init__(self, board: List[List[int]]):
+        """
+        构造函数
+        
+        参数:
+            board: 二维列表，0表示空位
+                   例如 3x3 棋盘: [[1,2,3], [4,5,6], [7,8,0]]
+        """
+        self.size = len(board)  # 棋盘大小等于行数
+        # 第一次遇到这个大小时构建查找表
+        if self.size not in NEIGHBOR_IDX:
+            _build_tables(self.size)
+        # 按行展开成一维字节数组
+        self._buf = bytearray(cell for row in board for cell in row)
+        self.blank_idx = self._find_blank()  # 找到空位位置
+        self._hash_key = None
+        self._zhash = self._compute_zhash()
+    
+    @classmethod
+    def _from_buf(cls, size: int, buf: bytearray, blank_idx: int,
+                  zhash: Optional[int] = None) -> 'PuzzleState':
+        """
+        直接用一维数组创建状态（跳过二维列表的展开）
+        
+        参数:
+            size: 棋盘大小
+            buf: 一维棋盘（直接使用，不再拷贝）
+            blank_idx: 空位下标
+            zhash: 已知的Zobrist哈希值，None表示重新计算
+        """
+        state = cls.__new__(cls)
+        state.size = size
+        state._buf = buf
+        state.blank_idx = blank_idx
+        state._hash_key = None
+        state._zhash = state._compute_zhash() if zhash is None else zhash
+        return state
+    
+    @staticmethod
+    def from_board(board: List[List[int]]) -> 'PuzzleState':
+        """
+        根据二维棋盘创建状态
+        
+        任何大小都返回PuzzleState：打包的PackedPuzzleState15和PuzzleState
+        互不相等、哈希键类型也不同，工厂函数返回两种类型的话，同一个棋盘会因为
+        来源不同而比较不相等。需要打包表示时直接构造PackedPuzzleState15
+        
+        参数:
+            board: 二维列表，0表示空位
+        """
+        return PuzzleState(board)
     
-    # 以下字段使用field(init=False)，表示不在__init__中初始化
-    # 它们会在__post_init__中自动计算
-    size: int = field(init=False)
-    blank_pos: Tuple[int, int] = field(init=False)
+    @staticmethod
+    def from_flat(flat: bytes) -> 'PuzzleState':
+        """
+        根据按行展开的一维棋盘创建状态（同from_board，总是返回PuzzleState）
+        
+        参数:
+            flat: 一维棋盘，长度为size*size，0表示空位
+        """
+        size = int(len(flat) ** 0.5)
+        # 第一次遇到这个大小时构建查找表（_from_buf不会建表）
+        if size not in NEIGHBOR_IDX:
+            _build_tables(size)
+        buf = bytearray(flat)
+        return PuzzleState._from_buf(size, buf, buf.index(0))
     
-    def __post_init__(self):
+    def _compute_zhash(self) -> int:
         """
-        后初始化方法
-        在__init__执行完毕后自动调用
-        用于计算size和blank_pos
+        从头计算Zobrist哈希值（只在创建状态时调用一次）
         """
-        self.size = len(self.board)  # 棋盘大小等于行数
-        self.blank_pos = self._find_blank()  # 找到空位位置
+        table = ZOBRIST[self.size]
+        return reduce(xor, (table[i][v] for i, v in enumerate(self._buf)), 0)
     
-    def _find_blank(self) -> Tuple[int, int]:
+    def _find_blank(self) -> int:
         """
         找到空位(0)的位置
         
         返回值:
-            (行号, 列号) 元组
+            空位在一维数组中的下标
+        """
+        try:
+            # bytearray.index在C层面扫描，比逐格比较快
+            return self._buf.index(0)
+        except ValueError:
+            # 如果没找到，抛出异常
+            raise ValueError("棋盘中没有空位(0)")
+    
+    @property
+    def board(self) -> List[List[int]]:
+        """
+        二维列表形式的棋盘（每次调用都会重新构建）
+        
+        主要用于网络传输和界面显示，热点路径请避免在循环中反复访问
+        """
+        size = self.size
+        buf = self._buf
+        return [list(buf[i:i + size]) for i in range(0, size * size, size)]
+    
+    @property
+    def flat(self) -> bytearray:
+        """
+        一维棋盘（内部数组本身，不拷贝，不要修改）
+        
+        启发函数等热点路径应该用它代替board
         """
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.board[i][j] == 0:
-                    return (i, j)
-        # 如果没找到，抛出异常
-        raise ValueError("棋盘中没有空位(0)")
+        return self._buf
+    
+    @property
+    def blank_pos(self) -> Tuple[int, int]:
+        """空位位置 (行号, 列号)"""
+        return divmod(self.blank_idx, self.size)
     
     def copy(self) -> 'PuzzleState':
         """
@@ -111,32 +406,32 @@ class PuzzleState:
         返回值:
             新的PuzzleState对象
         """
-        # 列表推导式创建二维数组的深拷贝
-        # row[:] 创建row的浅拷贝
-        new_board = [row[:] for row in self.board]
-        return PuzzleState(new_board)
+        # bytearray(...) 复制整块连续内存
+        new_state = PuzzleState._from_buf(
+            self.size, bytearray(self._buf), self.blank_idx, self._zhash
+        )
+        # 哈希键是不可变的bytes，内容相同时可以直接共享
+        new_state._hash_key = self._hash_key
+        return new_state
     
-    def get_valid_moves(self) -> List[Direction]:
+    def get_valid_moves(self) -> Tuple[Direction, ...]:
         """
         获取当前状态下所有有效的移动方向
         
         返回值:
-            可以移动的方向列表
+            可以移动的方向元组（预先计算好的共享对象，不要修改）
         """
-        moves = []
-        r, c = self.blank_pos  # 获取空位的行和列
-        
-        # 检查每个方向是否可行
-        if r > 0:  # 不在第一行，可以向上
-            moves.append(Direction.UP)
-        if r < self.size - 1:  # 不在最后一行，可以向下
-            moves.append(Direction.DOWN)
-        if c > 0:  # 不在第一列，可以向左
-            moves.append(Direction.LEFT)
-        if c < self.size - 1:  # 不在最后一列，可以向右
-            moves.append(Direction.RIGHT)
+        # 直接查表，不再做边界判断
+        return _VALID_MOVES_CACHE[self.size][self.blank_idx]
+    
+    def get_valid_codes(self) -> Tuple[int, ...]:
+        """
+        获取当前状态下所有有效移动的方向编号（求解器内部使用）
         
-        return moves
+        返回值:
+            方向编号元组（预先计算好的共享对象，不要修改）
+        """
+        return _VALID_CODES_CACHE[self.size][self.blank_idx]
     
     def move(self, direction: Direction) -> bool:
         """
@@ -148,25 +443,41 @@ class PuzzleState:
         返回值:
             True表示移动成功，False表示无效移动
         """
-        # 检查方向是否有效
-        if direction not in self.get_valid_moves():
-            return False
+        return self.move_code(DIRECTION_TO_CODE[direction])
+    
+    def move_code(self, code: int) -> bool:
+        """
+        按方向编号执行移动（求解器内部使用，省去Enum转换）
+        
+        参数:
+            code: 方向编号（DIR_UP/DIR_DOWN/DIR_LEFT/DIR_RIGHT）
         
-        # 获取当前空位位置
-        r, c = self.blank_pos
+        返回值:
+            True表示移动成功，False表示无效移动
+        """
+        size = self.size
+        blank_idx = self.blank_idx
         
-        # 获取方向对应的偏移量
-        dr, dc = DIRECTION_DELTA[direction]
+        # 一次查表同时完成合法性判断和目标位置计算（无效方向为-1）
+        new_idx = NEIGHBOR_IDX[size][blank_idx][code]
+        if new_idx < 0:
+            return False  # 该方向无效
         
-        # 计算新位置
-        new_r, new_c = r + dr, c + dc
+        # 在一维数组上交换空位和目标格子（与move_flat相同，这里内联省一次函数调用）
+        buf = self._buf
+        tile = buf[new_idx]
+        buf[blank_idx] = tile  # 数字移到空位
+        buf[new_idx] = 0       # 新位置变成空位
         
-        # 交换空位和目标位置的值
-        self.board[r][c] = self.board[new_r][new_c]  # 数字移到空位
-        self.board[new_r][new_c] = 0                  # 新位置变成空位
+        # 增量更新Zobrist哈希：异或掉旧的两格，再异或进新的两格
+        z_old, z_new = ZOBRIST[size][blank_idx], ZOBRIST[size][new_idx]
+        self._zhash ^= z_old[0] ^ z_old[tile] ^ z_new[tile] ^ z_new[0]
         
         # 更新空位位置
-        self.blank_pos = (new_r, new_c)
+        self.blank_idx = new_idx
+        
+        # 棋盘变了，缓存的哈希键失效
+        self._hash_key = None
         
         return True
     
@@ -183,37 +494,31 @@ class PuzzleState:
         返回值:
             True表示已达到目标状态
         """
-        expected = 1  # 期望的数字，从1开始
-        
-        for i in range(self.size):
-            for j in range(self.size):
-                # 最后一个位置应该是空位(0)
-                if i == self.size - 1 and j == self.size - 1:
-                    if self.board[i][j] != 0:
-                        return False
-                else:
-                    # 其他位置应该按顺序是1,2,3,...
-                    if self.board[i][j] != expected:
-                        return False
-                    expected += 1
-        
-        return True
+        # 与缓存的目标字节串整体比较（C层面的memcmp）
+        return self._buf == GOAL_BYTES[self.size]
     
-    def to_tuple(self) -> Tuple[int, ...]:
+    def to_tuple(self) -> bytes:
         """
-        将棋盘转换为元组（用于哈希）
+        将棋盘转换为不可变的键（用于哈希）
+        
+        bytes和元组一样不可变，可以作为字典的键或集合的元素，
+        而且哈希时直接在C层面处理整块内存
         
-        元组是不可变的，可以作为字典的键或集合的元素
+        结果会缓存起来，直到下一次move才重新生成
         """
-        # 生成器表达式 + tuple() 将二维数组扁平化为一维元组
-        return tuple(cell for row in self.board for cell in row)
+        if self._hash_key is None:
+            self._hash_key = bytes(self._buf)
+        return self._hash_key
     
     def __hash__(self):
         """
         计算哈希值
         使棋盘状态可以作为字典的键
+        
+        直接返回增量维护的Zobrist哈希，O(1)
+        哈希冲突由__eq__逐字节比较兜底
         """
-        return hash(self.to_tuple())
+        return self._zhash
     
     def __eq__(self, other):
         """
@@ -221,28 +526,409 @@ class PuzzleState:
         """
         if not isinstance(other, PuzzleState):
             return False
-        return self.board == other.board
+        # 两块字节数组直接比较（C层面的memcmp）
+        return self._buf == other._buf
     
     def __str__(self):
         """
         将棋盘转换为字符串（用于打印）
         """
-        lines = []
-        # 计算最宽数字的宽度（用于对齐）
-        cell_width = len(str(self.size * self.size - 1))
+        # 每行一次format调用，空位用空串代替（右对齐后就是空格）
+        fmt = ROW_FORMAT[self.size]
+        return "\n".join(
+            fmt.format(*[cell or '' for cell in row]) for row in self.board
+        )
+    
+    def __repr__(self):
+        """调试用的简短表示"""
+        return f"{type(self).__name__}(board={self.board})"
+
+
+# ==================== 4x4打包状态 ====================
+
+# 4x4棋盘每格的数字是0~15，恰好占4位（一个半字节）
+# 16格一共64位，整块棋盘可以打包成一个整数：第idx格占第 4*idx ~ 4*idx+3 位
+# 移动、比较、哈希都变成几次位运算
+
+# 目标状态 1,2,...,15,0 打包后的整数
+GOAL_PACKED_15 = sum(val << (4 * idx) for idx, val in enumerate(range(1, 16)))
+
+
+def pack_board(flat) -> int:
+    """
+    把一维棋盘打包成整数（每格4位）
+    
+    参数:
+        flat: 一维棋盘（bytes/bytearray/列表），每格的值必须小于16
+    
+    返回值:
+        打包后的整数
+    """
+    packed = 0
+    for idx, val in enumerate(flat):
+        packed |= val << (4 * idx)
+    return packed
+
+
+def unpack_board(packed: int, cells: int) -> bytearray:
+    """
+    把打包的整数还原成一维棋盘
+    
+    参数:
+        packed: 打包后的整数
+        cells: 格子总数（4x4为16）
+    
+    返回值:
+        一维棋盘
+    """
+    return bytearray((packed >> (4 * idx)) & 0xF for idx in range(cells))
+
+
+@dataclass(init=False, eq=False, repr=False)
+class PackedPuzzleState15:
+    """
+    4x4棋盘（15数码）的打包状态类
+    
+    整个棋盘存成一个64位整数，接口与PuzzleState相同。
+    工厂函数（from_board/from_flat/load_puzzle_from_file）不会返回它，需要时直接构造
+    
+    注意：只和同类型的状态比较相等，不要和PuzzleState混放在同一个集合里
+    
+    属性:
+        size: 棋盘大小（固定为4）
+        blank_idx: 空位在一维数组中的下标
+        packed: 打包后的棋盘
+    """
+    size: int
+    blank_idx: int
+    packed: int
+    
+    __slots__ = ('size', 'blank_idx', 'packed')
+    
+    def __init__(self, board: List[List[int]]):
+        """
+        构造函数
+        
+        参数:
+            board: 4x4的二维列表，0表示空位
+        """
+        if len(board) != 4:
+            raise ValueError("PackedPuzzleState15 只支持4x4棋盘")
+        self.size = 4
+        # 确保4x4的邻居表已经构建
+        if 4 not in NEIGHBOR_IDX:
+            _build_tables(4)
+        flat = [cell for row in board for cell in row]
+        self.packed = pack_board(flat)
+        if 0 not in flat:
+            raise ValueError("棋盘中没有空位(0)")
+        self.blank_idx = flat.index(0)
+    
+    @property
+    def board(self) -> List[List[int]]:
+        """二维列表形式的棋盘（每次调用都会重新解包）"""
+        flat = unpack_board(self.packed, 16)
+        return [list(flat[i:i + 4]) for i in range(0, 16, 4)]
+    
+    @property
+    def flat(self) -> bytearray:
+        """一维棋盘（每次调用都会重新解包）"""
+        return unpack_board(self.packed, 16)
+    
+    @property
+    def blank_pos(self) -> Tuple[int, int]:
+        """空位位置 (行号, 列号)"""
+        return divmod(self.blank_idx, 4)
+    
+    def copy(self) -> 'PackedPuzzleState15':
+        """
+        拷贝（只需复制两个整数）
+        """
+        new_state = PackedPuzzleState15.__new__(PackedPuzzleState15)
+        new_state.size = 4
+        new_state.blank_idx = self.blank_idx
+        new_state.packed = self.packed
+        return new_state
+    
+    def get_valid_moves(self) -> Tuple[Direction, ...]:
+        """获取当前状态下所有有效的移动方向"""
+        return _VALID_MOVES_CACHE[4][self.blank_idx]
+    
+    def get_valid_codes(self) -> Tuple[int, ...]:
+        """获取当前状态下所有有效移动的方向编号"""
+        return _VALID_CODES_CACHE[4][self.blank_idx]
+    
+    def move(self, direction: Direction) -> bool:
+        """
+        执行移动操作（移动空位）
+        
+        参数:
+            direction: 移动方向
+        
+        返回值:
+            True表示移动成功，False表示无效移动
+        """
+        return self.move_code(DIRECTION_TO_CODE[direction])
+    
+    def move_code(self, code: int) -> bool:
+        """
+        按方向编号执行移动
         
-        for row in self.board:
-            line = " ".join(
-                str(cell).rjust(cell_width) if cell != 0 else " " * cell_width
-                for cell in row
-            )
-            lines.append(line)
+        参数:
+            code: 方向编号
         
-        return "\n".join(lines)
+        返回值:
+            True表示移动成功，False表示无效移动
+        """
+        new_idx = NEIGHBOR_IDX[4][self.blank_idx][code]
+        if new_idx < 0:
+            return False
+        
+        # 取出目标格子的数字，清空目标格子，再把数字写到原空位（原空位本来就是0）
+        shift_new = 4 * new_idx
+        val = (self.packed >> shift_new) & 0xF
+        self.packed = (self.packed & ~(0xF << shift_new)) | (val << (4 * self.blank_idx))
+        
+        self.blank_idx = new_idx
+        return True
+    
+    def is_goal(self) -> bool:
+        """检查是否达到目标状态（一次整数比较）"""
+        return self.packed == GOAL_PACKED_15
+    
+    def to_tuple(self) -> int:
+        """哈希键：打包后的整数本身"""
+        return self.packed
+    
+    def __hash__(self):
+        """哈希值就是打包后的整数"""
+        return hash(self.packed)
+    
+    def __eq__(self, other):
+        """判断两个打包状态是否相等"""
+        if not isinstance(other, PackedPuzzleState15):
+            return False
+        return self.packed == other.packed
+    
+    # 打印格式与PuzzleState一致
+    __str__ = PuzzleState.__str__
+    __repr__ = PuzzleState.__repr__
+
+
+# ==================== 批量状态（BFS前沿） ====================
+
+# 分块扩展时每块棋盘数据的目标字节数（大致是L2缓存的大小）
+# 一块内的四个方向连续处理完，再处理下一块，块内数据一直留在缓存里
+FRONTIER_TILE_BYTES = 256 * 1024
+
+class PuzzleFrontier:
+    """
+    一批同样大小的棋盘状态（用于BFS逐层扩展）
+    
+    和每个状态一个PuzzleState对象不同，这里把所有棋盘首尾相接存进同一个
+    bytearray（第i个状态占 boards[i*n² : (i+1)*n²]），空位下标单独存在一个
+    整数数组里。每个状态只占 n²+4 字节的连续内存，没有逐个对象的开销
+    
+    属性:
+        size: 棋盘大小
+        cells: 每个棋盘的格子数（size * size）
+        boards: 所有棋盘拼接成的一维字节数组
+        blanks: 每个状态的空位下标
+    """
+    
+    def __init__(self, size: int):
+        """
+        构造函数：创建一个空的前沿
+        
+        参数:
+            size: 棋盘大小
+        """
+        if size not in NEIGHBOR_IDX:
+            _build_tables(size)
+        self.size = size
+        self.cells = size * size
+        self.boards = bytearray()
+        self.blanks = array('i')
+    
+    @classmethod
+    def from_states(cls, states) -> 'PuzzleFrontier':
+        """
+        由若干个状态创建前沿
+        
+        参数:
+            states: PuzzleState/PackedPuzzleState15的可迭代对象（大小必须相同）
+        """
+        frontier = None
+        for state in states:
+            if frontier is None:
+                frontier = cls(state.size)
+            frontier.append(state.to_tuple() if isinstance(state, PuzzleState)
+                            else bytes(unpack_board(state.packed, 16)),
+                            state.blank_idx)
+        if frontier is None:
+            raise ValueError("至少需要一个状态")
+        return frontier
+    
+    def __len__(self) -> int:
+        """前沿中的状态个数"""
+        return len(self.blanks)
+    
+    def append(self, buf, blank_idx: int):
+        """
+        追加一个状态
+        
+        参数:
+            buf: 一维棋盘（bytes/bytearray，长度为cells）
+            blank_idx: 空位下标
+        """
+        self.boards += buf
+        self.blanks.append(blank_idx)
+    
+    def get_board(self, i: int) -> bytes:
+        """第i个状态的一维棋盘（可以直接作为visited集合的键）"""
+        offset = i * self.cells
+        return bytes(self.boards[offset:offset + self.cells])
+    
+    def to_state(self, i: int) -> PuzzleState:
+        """把第i个状态还原成PuzzleState对象"""
+        offset = i * self.cells
+        return PuzzleState._from_buf(
+            self.size, self.boards[offset:offset + self.cells], self.blanks[i]
+        )
+    
+    def expand_all(self, seen: Optional[set] = None) -> 'PuzzleFrontier':
+        """
+        一次性扩展所有状态，生成下一层前沿
+        
+        前沿按块处理（每块约FRONTIER_TILE_BYTES字节的棋盘数据）；
+        每块内按方向分四趟扫描：每一趟只处理一个方向，对所有空位在该方向
+        有邻居的状态，复制棋盘并交换两个格子
+        
+        参数:
+            seen: 已访问棋盘（bytes）的集合；给出时跳过已访问的子状态，
+                  并把新子状态加入集合
+        
+        返回值:
+            由所有子状态组成的新前沿
+        """
+        cells = self.cells
+        boards = self.boards
+        blanks = self.blanks
+        neighbor_idx = NEIGHBOR_IDX[self.size]
+        
+        children = PuzzleFrontier(self.size)
+        out_boards = children.boards
+        out_blanks = children.blanks
+        
+        num = len(blanks)
+        tile = max(1, FRONTIER_TILE_BYTES // cells)  # 每块的状态数
+        
+        for start in range(0, num, tile):
+            end = min(start + tile, num)
+            
+            # 同一块连续做完四个方向，再进入下一块
+            for code in range(4):
+                for i in range(start, end):
+                    blank = blanks[i]
+                    new_idx = neighbor_idx[blank][code]
+                    if new_idx < 0:
+                        continue  # 空位在这个方向上没有邻居
+                    
+                    offset = i * cells
+                    child = boards[offset:offset + cells]
+                    child[blank] = child[new_idx]
+                    child[new_idx] = 0
+                    
+                    if seen is not None:
+                        key = bytes(child)
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                    
+                    out_boards += child
+                    out_blanks.append(new_idx)
+        
+        return children
 
 
 # ==================== 可解性判断 ====================
 
+def _merge_count(arr: List[int]) -> Tuple[List[int], int]:
+    """
+    归并排序的同时统计逆序数（分治法，O(n log n)）
+    
+    参数:
+        arr: 一维整数列表
+    
+    返回值:
+        (排好序的列表, 逆序数) 元组
+    """
+    n = len(arr)
+    if n <= 1:
+        return arr, 0
+    
+    # 分：拆成左右两半，分别递归求解
+    mid = n // 2
+    left, left_inv = _merge_count(arr[:mid])
+    right, right_inv = _merge_count(arr[mid:])
+    
+    # 治：合并两个有序列表
+    merged = []
+    inversions = left_inv + right_inv
+    i = j = 0
+    while i < len(left) and j < len(right):
+        if left[i] > right[j]:
+            # left[i:]中的每个数都比right[j]大，全部构成逆序对
+            inversions += len(left) - i
+            merged.append(right[j])
+            j += 1
+        else:
+            merged.append(left[i])
+            i += 1
+    
+    # 把剩余部分直接接到末尾
+    merged.extend(left[i:])
+    merged.extend(right[j:])
+    
+    return merged, inversions
+
+
+def _fenwick_count(arr: List[int], max_value: int) -> int:
+    """
+    用树状数组（Fenwick树）统计逆序数，O(n log m)，没有递归和列表切片
+    
+    从右往左扫描，树状数组记录已经出现过的数字，
+    每个数字左边比它大的数 = 右边已经出现的、比它小的数的个数之和
+    
+    参数:
+        arr: 一维整数列表，元素范围 1..max_value
+        max_value: 元素的最大值
+    
+    返回值:
+        逆序数
+    """
+    tree = [0] * (max_value + 1)
+    inversions = 0
+    
+    for val in reversed(arr):
+        # 查询：已出现的数字中比val小的个数（前缀和 1..val-1）
+        i = val - 1
+        while i > 0:
+            inversions += tree[i]
+            i &= i - 1  # 去掉最低位的1
+        # 更新：标记val已出现
+        i = val
+        while i <= max_value:
+            tree[i] += 1
+            i += i & -i  # 加上最低位的1
+    
+    return inversions
+
+
+# 数字个数达到这个值（即5x5及以上）时改用树状数组统计逆序数
+FENWICK_THRESHOLD = 16
+
+
 def count_inversions(board: List[List[int]]) -> int:
     """
     计算逆序数
@@ -250,6 +936,8 @@ def count_inversions(board: List[List[int]]) -> int:
     逆序数是指在一维序列中，大数在小数前面出现的次数
     例如 [2,1,3] 的逆序数是1（2在1前面）
     
+    小棋盘使用归并排序统计，大棋盘使用树状数组，复杂度都是O(n log n)
+    
     参数:
         board: 二维棋盘数组
     
@@ -259,14 +947,11 @@ def count_inversions(board: List[List[int]]) -> int:
     # 将二维数组扁平化为一维，同时过滤掉0
     flat = [cell for row in board for cell in row if cell != 0]
     
-    inversions = 0
-    
-    # 双重循环计算逆序数
-    for i in range(len(flat)):
-        for j in range(i + 1, len(flat)):
-            if flat[i] > flat[j]:  # 如果前面的数比后面的大
-                inversions += 1
+    # 大棋盘：树状数组是纯循环，不产生递归调用和临时列表
+    if len(flat) >= FENWICK_THRESHOLD:
+        return _fenwick_count(flat, max(flat))
     
+    _, inversions = _merge_count(flat)
     return inversions
 
 
@@ -337,7 +1022,7 @@ def load_puzzle_from_file(filepath: str) -> PuzzleState:
         if len(row) != size:
             raise ValueError(f"棋盘必须是正方形，期望{size}列，得到{len(row)}列")
     
-    return PuzzleState(board)
+    return PuzzleState.from_board(board)
 
 
 # ==================== 网络协议 ====================
@@ -358,6 +1043,26 @@ class MessageType(Enum):
     ERROR = "ERROR"            # 错误消息
 
 
+# 二进制协议中的编号：枚举成员在元组中的下标就是它的1字节编号
+_MSG_TYPES = tuple(MessageType)
+_MSG_TYPE_IDS = {msg_type: i for i, msg_type in enumerate(_MSG_TYPES)}
+# 方向直接沿用整数方向编码
+_DIRECTIONS = CODE_TO_DIRECTION
+_DIRECTION_IDS = DIRECTION_TO_CODE
+
+# 可选字段的存在位图
+_HAS_SOLVER_ID = 0x01
+_HAS_STEP_NUM = 0x02
+_HAS_DIRECTION = 0x04
+_HAS_BOARD = 0x08
+_HAS_TOTAL_STEPS = 0x10
+_HAS_ERROR = 0x20
+
+# 固定头部：消息类型(1B) + 位图(1B) + solver_id/step_num/total_steps(各4B) + 方向(1B)
+# 之后依次是可选的 棋盘大小(1B)+棋盘字节 和 UTF-8错误信息（直到结尾）
+_HEADER = struct.Struct('>BBiiiB')
+
+
 @dataclass
 class Message:
     """
@@ -371,6 +1076,7 @@ class Message:
     step_num: Optional[int] = None                  # 当前步数
     direction: Optional[Direction] = None           # 移动方向
     board_data: Optional[List[List[int]]] = None   # 棋盘数据
+    board_flat: Optional[bytes] = None              # 按行展开的棋盘（二进制协议解码出的就是它）
     total_steps: Optional[int] = None               # 总步数（游戏完成时）
     error_msg: Optional[str] = None                 # 错误信息
     
@@ -393,13 +1099,97 @@ class Message:
             data["direction"] = self.direction.value
         if self.board_data is not None:
             data["board"] = self.board_data
+        elif self.board_flat is not None:
+            size = int(len(self.board_flat) ** 0.5)
+            data["board"] = [list(self.board_flat[i:i + size]) for i in range(0, size * size, size)]
         if self.total_steps is not None:
             data["total_steps"] = self.total_steps
         if self.error_msg is not None:
             data["error"] = self.error_msg
         
-        # 使用json.dumps()转换为JSON字符串
-        return json.dumps(data)
+        # 转换为JSON字符串（优先使用orjson）
+        return _json_dumps(data)
+    
+    def to_bytes(self) -> bytes:
+        """
+        将消息编码为紧凑的二进制格式（网络传输使用）
+        
+        格式见模块中的_HEADER说明；to_json/from_json只保留用于调试
+        
+        返回值:
+            编码后的字节串
+        """
+        flags = 0
+        if self.solver_id is not None:
+            flags |= _HAS_SOLVER_ID
+        if self.step_num is not None:
+            flags |= _HAS_STEP_NUM
+        if self.direction is not None:
+            flags |= _HAS_DIRECTION
+        if self.board_data is not None or self.board_flat is not None:
+            flags |= _HAS_BOARD
+        if self.total_steps is not None:
+            flags |= _HAS_TOTAL_STEPS
+        if self.error_msg is not None:
+            flags |= _HAS_ERROR
+        
+        parts = [_HEADER.pack(
+            _MSG_TYPE_IDS[self.msg_type],
+            flags,
+            self.solver_id or 0,
+            self.step_num or 0,
+            self.total_steps or 0,
+            _DIRECTION_IDS[self.direction] if self.direction is not None else 0,
+        )]
+        
+        if self.board_flat is not None:
+            # 棋盘大小 + 按行展开的原始字节（已经是一维的，直接发送）
+            parts.append(bytes([int(len(self.board_flat) ** 0.5)]))
+            parts.append(self.board_flat)
+        elif self.board_data is not None:
+            # 棋盘大小 + 按行展开的原始字节
+            parts.append(bytes([len(self.board_data)]))
+            parts.append(bytes(cell for row in self.board_data for cell in row))
+        if self.error_msg is not None:
+            parts.append(self.error_msg.encode('utf-8'))
+        
+        return b''.join(parts)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Message':
+        """
+        从二进制格式解码消息（to_bytes的逆过程）
+        
+        参数:
+            data: 编码后的字节串
+        
+        返回值:
+            Message对象
+        """
+        type_id, flags, solver_id, step_num, total_steps, dir_id = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        
+        # 棋盘保持一维字节串，不再拆成二维列表（接收方用PuzzleState.from_flat）
+        board_flat = None
+        if flags & _HAS_BOARD:
+            size = data[offset]
+            offset += 1
+            board_flat = bytes(data[offset:offset + size * size])
+            offset += size * size
+        
+        error_msg = None
+        if flags & _HAS_ERROR:
+            error_msg = bytes(data[offset:]).decode('utf-8')
+        
+        return cls(
+            msg_type=_MSG_TYPES[type_id],
+            solver_id=solver_id if flags & _HAS_SOLVER_ID else None,
+            step_num=step_num if flags & _HAS_STEP_NUM else None,
+            direction=_DIRECTIONS[dir_id] if flags & _HAS_DIRECTION else None,
+            board_flat=board_flat,
+            total_steps=total_steps if flags & _HAS_TOTAL_STEPS else None,
+            error_msg=error_msg,
+        )
     
     @classmethod
     def from_json(cls, json_str: str) -> 'Message':
@@ -415,7 +1205,7 @@ class Message:
         注意：@classmethod使这个方法可以通过类调用：Message.from_json(...)
         """
         # 解析JSON
-        data = json.loads(json_str)
+        data = _json_loads(json_str)
         
         # 提取各字段
         msg_type = MessageType(data["type"])
@@ -451,74 +1241,208 @@ def send_message(sock, message: Message):
         sock: socket对象
         message: 要发送的消息
     """
-    # 将消息转换为JSON，再编码为UTF-8字节串
-    data = message.to_json().encode('utf-8')
+    send_messages(sock, (message,))
+
+
+def _frame_buffers(messages) -> List[bytes]:
+    """
+    把消息编码成帧，返回依次排列的 [长度头, 内容, 长度头, 内容, ...]
+    
+    参数:
+        messages: 要编码的消息
+    """
+    buffers = []
+    for message in messages:
+        # 将消息编码为二进制字节串
+        data = message.to_bytes()
+        # 将长度转换为4字节的大端序字节串
+        # to_bytes(4, 'big') 将整数转换为4字节，使用大端序
+        buffers.append(len(data).to_bytes(4, 'big'))
+        buffers.append(data)
+    return buffers
+
+
+def encode_messages(messages) -> bytes:
+    """
+    把消息编码成可以直接写进socket的字节串（每条消息一帧，和send_messages发出的内容相同）
+    
+    给自己管理发送缓冲区的一方使用（例如非阻塞socket）
+    
+    参数:
+        messages: 要按顺序编码的消息
+    
+    返回值:
+        所有帧拼接后的字节串
+    """
+    return b''.join(_frame_buffers(messages))
+
+
+def send_messages(sock, messages):
+    """
+    一次系统调用发送多条消息
+    
+    每条消息仍然是独立的一帧（长度头 + 内容），接收方照常逐条解析；
+    合在一起发送可以少几次系统调用，也不会被Nagle算法拆开延迟
+    
+    参数:
+        sock: socket对象
+        messages: 要按顺序发送的消息
+    """
+    buffers = _frame_buffers(messages)
+    
+    # 没有sendmsg的平台（如Windows）：拼接后一起发送
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(buffers))
+        return
+    
+    # sendmsg把所有头部和数据作为多段缓冲区一次提交（scatter写），不需要先拼接
+    total = sum(len(buf) for buf in buffers)
+    sent = sock.sendmsg(buffers)
+    if sent < total:
+        # 极少数情况下只写出了一部分，剩余部分用sendall补发
+        sock.sendall(memoryview(b''.join(buffers))[sent:])
+
+
+def _recv_exact_into(sock, view: memoryview) -> bool:
+    """
+    从socket读取数据，直到把view填满
     
-    # 获取数据长度
-    length = len(data)
+    使用recv_into直接写入预先分配好的缓冲区，不产生中间字节串
     
-    # 将长度转换为4字节的大端序字节串，拼接上数据一起发送
-    # to_bytes(4, 'big') 将整数转换为4字节，使用大端序
-    sock.sendall(length.to_bytes(4, 'big') + data)
+    参数:
+        sock: socket对象
+        view: 目标缓冲区的memoryview
+    
+    返回值:
+        True表示填满，False表示连接中途断开
+    """
+    total = len(view)
+    got = 0
+    while got < total:
+        # 每次最多接收BUFFER_SIZE字节
+        n = sock.recv_into(view[got:], min(total - got, BUFFER_SIZE))
+        if not n:
+            return False  # 连接断开
+        got += n
+    return True
 
 
-def recv_message(sock) -> Optional[Message]:
+def recv_message(sock, buffer: Optional[bytearray] = None) -> Optional[Message]:
     """
     接收消息
     
     参数:
         sock: socket对象
+        buffer: 可选，调用者反复使用的接收缓冲区（至少4字节）。
+                消息不超过它的大小时直接读进去，不再为每条消息分配内存
     
     返回值:
         Message对象，如果连接断开则返回None
     """
-    # 先接收4字节的长度
-    length_data = sock.recv(4)
-    if not length_data:
+    if buffer is None:
+        buffer = bytearray(4)
+    view = memoryview(buffer)
+    
+    # 先接收4字节的长度（可能分多次到达）
+    if not _recv_exact_into(sock, view[:4]):
         return None  # 连接已断开
     
     # 将4字节转换为整数
-    length = int.from_bytes(length_data, 'big')
+    length = int.from_bytes(view[:4], 'big')
     
-    # 接收完整的数据
-    data = b''  # 空字节串
-    while len(data) < length:
-        # 每次最多接收BUFFER_SIZE字节
-        chunk = sock.recv(min(length - len(data), BUFFER_SIZE))
-        if not chunk:
-            return None  # 连接断开
-        data += chunk  # 拼接
+    # 放得下就复用缓冲区，否则按长度一次性分配，再把数据读进去
+    if length <= len(buffer):
+        data = view[:length]
+    else:
+        data = memoryview(bytearray(length))
+    if not _recv_exact_into(sock, data):
+        return None  # 连接断开
+    
+    # 解码为Message对象
+    return Message.from_bytes(data)
+
+
+class MessageReader:
+    """
+    按帧读取消息，给用selector等待多个连接的一方使用
+    
+    selector报告socket可读时，只保证至少有1个字节（或连接关闭），
+    一次recv可能只收到半条消息，也可能收到好几条。
+    recv_message会阻塞到整条消息收齐，一个线程管多个连接时不能这样等；
+    这里把收到的字节攒在缓冲区里，每次只解出已经完整的消息
+    """
+    
+    __slots__ = ('sock', '_buf')
     
-    # 解码并反序列化为Message对象
-    return Message.from_json(data.decode('utf-8'))
+    def __init__(self, sock):
+        """
+        参数:
+            sock: socket对象
+        """
+        self.sock = sock
+        self._buf = bytearray()
+    
+    def read_messages(self) -> Optional[List[Message]]:
+        """
+        读一次socket（可读时调用，不会阻塞），解出所有已经完整的消息
+        
+        返回值:
+            消息列表（可能为空，表示还没收齐一条）；连接断开时返回None
+        """
+        try:
+            data = self.sock.recv(BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+        except ConnectionError:
+            return None
+        if not data:
+            return None  # 连接断开
+        
+        buf = self._buf
+        buf += data
+        
+        # 依次取出完整的帧：4字节长度 + 消息内容
+        messages = []
+        offset = 0
+        with memoryview(buf) as view:
+            while len(buf) - offset >= 4:
+                end = offset + 4 + int.from_bytes(view[offset:offset + 4], 'big')
+                if end > len(buf):
+                    break  # 这条消息还没收齐
+                messages.append(Message.from_bytes(view[offset + 4:end]))
+                offset = end
+        
+        # 丢掉已经解码的部分，剩下的半条消息留到下次
+        del buf[:offset]
+        return messages
 
 
 # ==================== 目标状态生成 ====================
 
+# GOAL_STATES[size] -> 缓存的目标状态（只用来拷贝，不直接交给调用者）
+GOAL_STATES: Dict[int, PuzzleState] = {}
+
+
 def get_goal_state(size: int) -> PuzzleState:
     """
     生成指定大小的目标状态
     
+    每个大小只构建一次，之后返回缓存状态的拷贝（调用者可以放心修改）
+    
     参数:
         size: 棋盘大小
     
     返回值:
         目标状态的PuzzleState对象
     """
-    board = []
-    num = 1
-    
-    for i in range(size):
-        row = []
-        for j in range(size):
-            if i == size - 1 and j == size - 1:
-                row.append(0)  # 最后一个位置是空位
-            else:
-                row.append(num)
-                num += 1
-        board.append(row)
-    
-    return PuzzleState(board)
+    goal = GOAL_STATES.get(size)
+    if goal is None:
+        if size not in NEIGHBOR_IDX:
+            _build_tables(size)
+        goal = PuzzleState._from_buf(size, bytearray(GOAL_BYTES[size]), size * size - 1)
+        GOAL_STATES[size] = goal
+    
+    return goal.copy()
 
 
 # ==================== 测试代码 ====================
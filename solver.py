@@ -9,13 +9,97 @@ IDA* (Iterative Deepening A*) 算法的特点：
 """
 
 # ==================== 导入模块 ====================
-from typing import List, Optional, Tuple
-from common import PuzzleState, Direction, DIRECTION_DELTA, OPPOSITE_DIRECTION, get_goal_state
+import os
+import math
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple, Dict, Callable
+from common import (
+    PuzzleState, Direction, DIRECTION_DELTA, CODE_TO_DIRECTION, DIRECTION_TO_CODE,
+    NEXT_CODES, NO_LAST_MOVE, NEIGHBOR_IDX, GOAL_BYTES, ZOBRIST, DIR_DOWN, get_goal_state,
+    PuzzleFrontier
+)
 
 
 # ==================== 启发函数 ====================
 # 启发函数用于估计从当前状态到目标状态的最小步数
 # 好的启发函数可以大幅减少搜索的节点数
+# 所有启发函数都在一维棋盘 state.flat 上计算，下标 idx = 行号 * size + 列号
+
+# GOAL_ROW[size][val] / GOAL_COL[size][val] -> 数字val的目标行/目标列
+# 下标0对应空位，不会被用到
+GOAL_ROW: Dict[int, Tuple[int, ...]] = {}
+GOAL_COL: Dict[int, Tuple[int, ...]] = {}
+
+# MANHATTAN[size][val][pos] -> 数字val在位置pos时到目标位置的曼哈顿距离
+# MANHATTAN[size][0]全是0（空位不计入距离），一次查表代替除法、取模和abs
+MANHATTAN: Dict[int, Tuple[Tuple[int, ...], ...]] = {}
+
+
+def _build_goal_tables(size: int):
+    """
+    构建指定大小棋盘的目标行/列查找表和曼哈顿距离表
+    
+    例如数字5在3x3棋盘中应该在第1行第1列 (5-1)//3=1, (5-1)%3=1
+    
+    后台预测线程可能同时求解，所以先全部在局部变量里建好，再在锁里一起发布；
+    调用方都以MANHATTAN里有没有size判断表是否就绪，它最后赋值
+    
+    参数:
+        size: 棋盘大小
+    """
+    goal_row = (0,) + tuple((val - 1) // size for val in range(1, size * size))
+    goal_col = (0,) + tuple((val - 1) % size for val in range(1, size * size))
+    manhattan = ((0,) * (size * size),) + tuple(
+        tuple(abs(pos // size - goal_row[val]) + abs(pos % size - goal_col[val])
+              for pos in range(size * size))
+        for val in range(1, size * size)
+    )
+    manhattan_sum = _specialize_manhattan(size, manhattan)
+    
+    with _table_lock('goal', size):
+        if size in MANHATTAN:
+            return  # 别的线程已经建好了
+        GOAL_ROW[size] = goal_row
+        GOAL_COL[size] = goal_col
+        _ROW_CONFLICT_CACHE[size] = [{} for _ in range(size)]
+        _COL_CONFLICT_CACHE[size] = [{} for _ in range(size)]
+        _MANHATTAN_SUM[size] = manhattan_sum
+        MANHATTAN[size] = manhattan
+
+
+# _MANHATTAN_SUM[size](flat) -> 整个棋盘的曼哈顿距离之和
+# 棋盘大小在一局游戏里是固定的，所以针对每个size生成一个展开的求和函数：
+# 格子下标全部写成字面常量，省掉enumerate、循环和列表的开销
+_MANHATTAN_SUM: Dict[int, Callable[[bytearray], int]] = {}
+
+
+def _specialize_manhattan(
+    size: int,
+    manhattan: Tuple[Tuple[int, ...], ...]
+) -> Callable[[bytearray], int]:
+    """
+    生成指定大小棋盘专用的曼哈顿距离求和函数
+    
+    例如size=2时生成:
+        def manhattan_sum(flat):
+            return (MD[flat[0]][0] + MD[flat[1]][1] + MD[flat[2]][2] + MD[flat[3]][3])
+    
+    参数:
+        size: 棋盘大小
+        manhattan: 这个大小的曼哈顿距离表（即MANHATTAN[size]）
+    
+    返回值:
+        接受一维棋盘、返回曼哈顿距离之和的函数
+    """
+    terms = " + ".join(f"MD[flat[{idx}]][{idx}]" for idx in range(size * size))
+    source = f"def manhattan_sum(flat):\n    return ({terms})\n"
+    namespace = {'MD': manhattan}
+    exec(source, namespace)
+    return namespace['manhattan_sum']
+
 
 def manhattan_distance(state: PuzzleState) -> int:
     """
@@ -31,22 +115,11 @@ def manhattan_distance(state: PuzzleState) -> int:
         曼哈顿距离之和
     """
     size = state.size
-    distance = 0
-    
-    for i in range(size):
-        for j in range(size):
-            val = state.board[i][j]
-            
-            if val != 0:  # 跳过空位
-                # 计算这个数字的目标位置
-                # 例如数字5在3x3棋盘中应该在第1行第1列 (5-1)//3=1, (5-1)%3=1
-                goal_i = (val - 1) // size  # 目标行
-                goal_j = (val - 1) % size   # 目标列
-                
-                # 累加曼哈顿距离
-                distance += abs(i - goal_i) + abs(j - goal_j)
+    if size not in MANHATTAN:
+        _build_goal_tables(size)
     
-    return distance
+    # 每格查一次表（空位那一行全是0，不用特判）
+    return _MANHATTAN_SUM[size](state.flat)
 
 
 def linear_conflict(state: PuzzleState) -> int:
@@ -66,70 +139,409 @@ def linear_conflict(state: PuzzleState) -> int:
         曼哈顿距离 + 线性冲突惩罚
     """
     size = state.size
-    conflict = 0
+    if size not in MANHATTAN:
+        _build_goal_tables(size)
+    flat = state.flat  # 只取一次（打包状态每次取都要解包）
     
-    # 检查行冲突
+    # 曼哈顿距离部分直接用展开的求和函数，不再经过manhattan_distance
+    h = _MANHATTAN_SUM[size](flat)
+    
+    # 加上行冲突和列冲突的惩罚
     for i in range(size):
-        for j in range(size):
-            val = state.board[i][j]
-            if val == 0:
-                continue
-            
-            # 计算这个数字的目标行
-            goal_i = (val - 1) // size
-            if goal_i != i:
-                continue  # 不在正确的行，跳过
-            
-            # 检查同一行右边的数字
-            for k in range(j + 1, size):
-                other = state.board[i][k]
-                if other == 0:
-                    continue
-                
-                # 计算另一个数字的目标行
-                other_goal_i = (other - 1) // size
-                if other_goal_i != i:
-                    continue  # 不在正确的行，跳过
-                
-                # 两个数字都在正确的行，检查相对顺序
-                goal_j = (val - 1) % size
-                other_goal_j = (other - 1) % size
-                
-                if goal_j > other_goal_j:  # 顺序错误（当前val应该在other右边，但实际在左边）
-                    conflict += 2
-    
-    # 检查列冲突（逻辑类似）
-    for j in range(size):
-        for i in range(size):
-            val = state.board[i][j]
-            if val == 0:
+        h += _row_conflict(flat, size, i) + _col_conflict(flat, size, i)
+    
+    return h
+
+
+def _count_conflict(goals: List[int]) -> int:
+    """
+    统计一条线上的冲突惩罚
+    
+    参数:
+        goals: 这条线上（已经在正确行/列的）数字的目标坐标，按出现顺序排列
+    
+    返回值:
+        冲突惩罚（每对顺序错误的数字加2）
+    """
+    conflict = 0
+    # 两两检查相对顺序
+    for a in range(len(goals)):
+        for b in range(a + 1, len(goals)):
+            if goals[a] > goals[b]:  # 顺序错误（前面的数字应该在后面）
+                conflict += 2
+    return conflict
+
+
+# 每条线的冲突惩罚只取决于这条线上的数字，搜索中同样的一行/一列会反复出现
+# _ROW_CONFLICT_CACHE[size][i] -> {第i行的bytes: 冲突惩罚}，列同理
+# 4x4每条线的不同内容只有16*15*14*13=43680种，可以全部缓存；
+# 5x5起每条线有几百万种，缓存满了就整张清空重新记录
+CONFLICT_CACHE_SIZE = 1 << 16
+_ROW_CONFLICT_CACHE: Dict[int, List[Dict[bytes, int]]] = {}
+_COL_CONFLICT_CACHE: Dict[int, List[Dict[bytes, int]]] = {}
+
+
+def _row_conflict(flat, size: int, i: int) -> int:
+    """第i行的线性冲突惩罚（按这一行的内容缓存）"""
+    line = bytes(flat[i * size:(i + 1) * size])
+    cache = _ROW_CONFLICT_CACHE[size][i]
+    conflict = cache.get(line)
+    if conflict is None:
+        if len(cache) >= CONFLICT_CACHE_SIZE:
+            cache.clear()
+        goal_row = GOAL_ROW[size]
+        goal_col = GOAL_COL[size]
+        # 这一行里目标行也是i的数字，按从左到右的顺序取出它们的目标列
+        conflict = cache[line] = _count_conflict(
+            [goal_col[val] for val in line if val and goal_row[val] == i]
+        )
+    return conflict
+
+
+def _col_conflict(flat, size: int, j: int) -> int:
+    """第j列的线性冲突惩罚（flat[j::size]就是第j列从上到下，按列的内容缓存）"""
+    line = bytes(flat[j::size])
+    cache = _COL_CONFLICT_CACHE[size][j]
+    conflict = cache.get(line)
+    if conflict is None:
+        if len(cache) >= CONFLICT_CACHE_SIZE:
+            cache.clear()
+        goal_row = GOAL_ROW[size]
+        goal_col = GOAL_COL[size]
+        conflict = cache[line] = _count_conflict(
+            [goal_row[val] for val in line if val and goal_col[val] == j]
+        )
+    return conflict
+
+
+def manhattan_delta(size: int, tile: int, from_idx: int, to_idx: int) -> int:
+    """
+    数字tile从from_idx移到to_idx后，曼哈顿距离的变化量
+    
+    一步移动只改变一个数字的位置，所以不用重算整个棋盘
+    
+    参数:
+        size: 棋盘大小
+        tile: 被移动的数字
+        from_idx: 移动前的位置
+        to_idx: 移动后的位置
+    
+    返回值:
+        新距离 - 旧距离（只可能是+1或-1）
+    """
+    md = MANHATTAN[size][tile]
+    return md[to_idx] - md[from_idx]
+
+
+# ==================== 行走距离 ====================
+# 行走距离（Walking Distance）只关心"每一行里有几个数字的目标行是第g行"：
+# 把棋盘压缩成一个 size x size 的计数矩阵 counts[r][g]，再加上空位所在的行。
+# 上下移动一步就是把相邻行的某个数字换到空位所在行，从目标状态出发BFS，
+# 就得到把所有数字挪回目标行至少需要的上下移动次数。列同理（表是同一张，
+# 因为目标状态关于主对角线对称）。行的值 + 列的值 是可采纳的启发值，
+# 通常比曼哈顿距离+线性冲突更紧
+#
+# 计数矩阵编码成一个整数键：counts[r][g] 占第 3*(r*size+g) 起的3位，
+# 空位所在的行放在最高的位上
+
+# 支持行走距离的棋盘大小（更大的棋盘状态数太多）
+WALKING_DISTANCE_SIZES = (3, 4)
+
+# WALKING_DISTANCE[size] -> {键: 最少上下移动次数}
+WALKING_DISTANCE: Dict[int, Dict[int, int]] = {}
+
+
+def _wd_shift(size: int, line: int, goal: int) -> int:
+    """计数 counts[line][goal] 在键中的位移"""
+    return 3 * (line * size + goal)
+
+
+def build_walking_distance(size: int) -> Dict[int, int]:
+    """
+    BFS构建行走距离表（4x4约两万五千个状态，不到一秒）
+    
+    参数:
+        size: 棋盘大小
+    
+    返回值:
+        {键: 最少上下移动次数}
+    """
+    blank_shift = 3 * size * size
+    
+    # 目标状态：第r行的size个数字目标都是第r行，最后一行少一个（空位）
+    start = (size - 1) << blank_shift
+    for r in range(size):
+        start += (size - (r == size - 1)) << _wd_shift(size, r, r)
+    
+    table = {start: 0}
+    queue = deque([start])
+    
+    while queue:
+        key = queue.popleft()
+        dist = table[key] + 1
+        blank_row = key >> blank_shift
+        
+        for row in (blank_row - 1, blank_row + 1):
+            if not 0 <= row < size:
                 continue
-            
-            goal_j = (val - 1) % size
-            if goal_j != j:
-                continue  # 不在正确的列，跳过
-            
-            for k in range(i + 1, size):
-                other = state.board[k][j]
-                if other == 0:
-                    continue
-                
-                other_goal_j = (other - 1) % size
-                if other_goal_j != j:
-                    continue
-                
-                goal_i = (val - 1) // size
-                other_goal_i = (other - 1) // size
-                
-                if goal_i > other_goal_i:  # 顺序错误
-                    conflict += 2
+            # 把第row行里一个目标为goal行的数字换到空位所在行
+            for goal in range(size):
+                shift = _wd_shift(size, row, goal)
+                if (key >> shift) & 7:
+                    new_key = (key - (1 << shift) + (1 << _wd_shift(size, blank_row, goal))
+                               + ((row - blank_row) << blank_shift))
+                    if new_key not in table:
+                        table[new_key] = dist
+                        queue.append(new_key)
+    
+    return table
+
+
+def _wd_keys(flat, size: int) -> Tuple[int, int]:
+    """
+    计算一维棋盘的(行键, 列键)
+    
+    列键把每一列当作"行"来统计，目标列作为目标行，所以可以查同一张表
+    """
+    if size not in MANHATTAN:
+        _build_goal_tables(size)
+    goal_row = GOAL_ROW[size]
+    goal_col = GOAL_COL[size]
+    blank_shift = 3 * size * size
+    row_key = col_key = 0
+    
+    for idx, val in enumerate(flat):
+        r, c = divmod(idx, size)
+        if val:
+            row_key += 1 << _wd_shift(size, r, goal_row[val])
+            col_key += 1 << _wd_shift(size, c, goal_col[val])
+        else:
+            row_key += r << blank_shift
+            col_key += c << blank_shift
+    
+    return row_key, col_key
+
+
+def walking_distance(state: PuzzleState) -> int:
+    """
+    行走距离启发函数
+    
+    参数:
+        state: 当前棋盘状态（大小必须在WALKING_DISTANCE_SIZES中）
+    
+    返回值:
+        行方向和列方向的行走距离之和
+    """
+    size = state.size
+    if size not in WALKING_DISTANCE:
+        WALKING_DISTANCE[size] = build_walking_distance(size)
+    table = WALKING_DISTANCE[size]
+    row_key, col_key = _wd_keys(state.flat, size)
+    return table[row_key] + table[col_key]
+
+
+# ==================== 模式数据库 ====================
+# 把数字分成几个不相交的组，对每组单独做一次从目标状态出发的反向BFS：
+# 只看这一组数字的位置（其他数字视为无差别），记录把它们归位至少要移动
+# 组内数字多少次。各组只统计移动自己组的数字，所以各组的值可以直接相加，
+# 结果仍然不会高估真实步数，而且比曼哈顿距离/线性冲突紧得多
+#
+# 组内数字的位置编码成一个整数键：第i个数字的位置占第 4*i ~ 4*i+3 位
+# （只支持不超过16格的棋盘），数据库就是以这个键为下标的bytearray
+
+# PATTERN_GROUPS[size] -> 不相交的数字分组（没有列出的大小不使用模式数据库）
+PATTERN_GROUPS: Dict[int, Tuple[Tuple[int, ...], ...]] = {
+    3: ((1, 2, 3, 4), (5, 6, 7, 8)),
+    4: ((1, 2, 3, 5, 6), (4, 7, 8, 11, 12), (9, 10, 13, 14, 15)),
+}
+
+# 数据库文件保存目录（和本文件放在一起），第一次构建后写入磁盘，以后直接读取
+PATTERN_DB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 数据库中表示"不可达"的值（只会出现在非法的键上）
+_PDB_UNREACHED = 0xFF
+
+# 已加载的数据库：_PATTERN_DBS[size] -> 与PATTERN_GROUPS[size]一一对应的表
+_PATTERN_DBS: Dict[int, List[bytearray]] = {}
+
+
+def build_pattern_db(size: int, tiles: Tuple[int, ...]) -> bytearray:
+    """
+    用0-1 BFS构建一组数字的模式数据库
+    
+    BFS的状态是(组内数字的位置键, 空位位置)：空位和组外数字交换不计步数（代价0），
+    和组内数字交换计1步。每个位置键取所有空位位置中的最小步数
+    
+    参数:
+        size: 棋盘大小（size * size 不超过16）
+        tiles: 这一组的数字
+    
+    返回值:
+        模式数据库，db[键] 是把这组数字归位的最少步数
+    """
+    get_goal_state(size)  # 确保邻居表已构建
+    cells = size * size
+    neighbors = [tuple(n for n in row if n >= 0) for row in NEIGHBOR_IDX[size]]
+    
+    space = 1 << (4 * len(tiles))
+    db = bytearray([_PDB_UNREACHED]) * space
+    visited = bytearray(space * cells)
+    
+    # 目标状态：数字t在位置t-1，空位在最后
+    start_key = sum((tile - 1) << (4 * i) for i, tile in enumerate(tiles))
+    queue = deque([(start_key, cells - 1, 0)])
+    
+    while queue:
+        key, blank, dist = queue.popleft()
+        visited_idx = key * cells + blank
+        if visited[visited_idx]:
+            continue
+        visited[visited_idx] = 1
+        if dist < db[key]:
+            db[key] = dist
+        
+        # 组内数字当前所在的位置 -> 它在组内的序号
+        occupied = {(key >> (4 * i)) & 0xF: i for i in range(len(tiles))}
+        
+        for n in neighbors[blank]:
+            slot = occupied.get(n)
+            if slot is None:
+                # 和组外数字交换：位置键不变，代价0，放到队首
+                if not visited[key * cells + n]:
+                    queue.appendleft((key, n, dist))
+            else:
+                # 和组内数字交换：该数字移到原空位，代价1
+                new_key = key + ((blank - n) << (4 * slot))
+                if not visited[new_key * cells + n]:
+                    queue.append((new_key, n, dist + 1))
+    
+    return db
+
+
+def _pattern_db_path(size: int, tiles: Tuple[int, ...]) -> str:
+    """数据库文件路径，例如 pdb_4x4_1-2-3-5-6.bin"""
+    name = f"pdb_{size}x{size}_{'-'.join(map(str, tiles))}.bin"
+    return os.path.join(PATTERN_DB_DIR, name)
+
+
+def load_pattern_dbs(size: int) -> Optional[List[bytearray]]:
+    """
+    加载指定大小棋盘的全部模式数据库（内存 -> 磁盘 -> 现场构建）
+    
+    现场构建后会尝试写入磁盘，写入失败不影响使用
+    
+    参数:
+        size: 棋盘大小
+    
+    返回值:
+        数据库列表，与PATTERN_GROUPS[size]一一对应；该大小不支持时返回None
+    """
+    if size in _PATTERN_DBS:
+        return _PATTERN_DBS[size]
+    if size not in PATTERN_GROUPS:
+        return None
     
-    # 返回曼哈顿距离 + 冲突惩罚
-    return manhattan_distance(state) + conflict
+    with _table_lock('pdb', size):
+        # 后台预热线程可能正在构建，拿到锁后再看一次
+        if size not in _PATTERN_DBS:
+            _PATTERN_DBS[size] = _load_or_build_pattern_dbs(size)
+    return _PATTERN_DBS[size]
+
+
+def _load_or_build_pattern_dbs(size: int) -> List[bytearray]:
+    """逐组从磁盘读取模式数据库，读不到的现场构建（见load_pattern_dbs）"""
+    dbs = []
+    for tiles in PATTERN_GROUPS[size]:
+        path = _pattern_db_path(size, tiles)
+        expected = 1 << (4 * len(tiles))
+        db = None
+        
+        # 先尝试从磁盘读取（长度不对说明文件损坏，重新构建）
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) == expected:
+                db = bytearray(data)
+        except OSError:
+            pass
+        
+        if db is None:
+            db = build_pattern_db(size, tiles)
+            # 先写到同目录的临时文件再改名：进程中途被杀、或者两个Solver同时构建时，
+            # 别人读到的要么是完整的旧文件，要么是完整的新文件，不会是写了一半的
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(db)
+                os.replace(tmp_path, path)
+            except OSError:
+                # 目录不可写时只在内存中使用
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        
+        dbs.append(db)
+    
+    return dbs
+
+
+def _pattern_keys(flat, size: int) -> List[int]:
+    """计算一维棋盘在每个分组下的位置键"""
+    pos = [0] * (size * size)
+    for idx, val in enumerate(flat):
+        pos[val] = idx
+    return [sum(pos[tile] << (4 * i) for i, tile in enumerate(tiles))
+            for tiles in PATTERN_GROUPS[size]]
+
+
+def pattern_db_heuristic(state: PuzzleState) -> int:
+    """
+    加性模式数据库启发函数
+    
+    每组查一次表再相加；棋盘大小不支持时退回线性冲突
+    
+    参数:
+        state: 当前棋盘状态
+    
+    返回值:
+        各组模式数据库值之和
+    """
+    dbs = load_pattern_dbs(state.size)
+    if dbs is None:
+        return linear_conflict(state)
+    keys = _pattern_keys(state.flat, state.size)
+    return sum(db[key] for db, key in zip(dbs, keys))
 
 
 # ==================== IDA* 算法 ====================
 
+# 置换表的最大条目数，满了就整张清空重新记录
+# （逐条删最早的键时，dict每次都要跳过前面已删除的空槽，越删越慢）
+TRANSPOSITION_TABLE_SIZE = 1 << 20
+
+
+class _Found(Exception):
+    """
+    找到解时抛出，直接跳出搜索
+    
+    这样_search的返回值永远是整数阈值，调用方不用再区分"路径"和"阈值"
+    """
+    __slots__ = ('path',)
+    
+    def __init__(self, path: List[int]):
+        super().__init__()
+        self.path = path  # 解的方向编号序列
+
+
+# 搜索中每扩展这么多个节点检查一次abort（必须是2的幂减1，用按位与判断）
+ABORT_CHECK_MASK = 0xFFF
+
+
+class _Aborted(Exception):
+    """abort被设置时抛出，直接跳出搜索（solve返回None）"""
+
+
 class IDAStar:
     """
     IDA* (Iterative Deepening A*) 求解器
@@ -141,26 +553,79 @@ class IDAStar:
     4. 重复直到找到解或证明无解
     """
     
-    def __init__(self, use_linear_conflict: bool = True):
+    def __init__(self, use_linear_conflict: bool = True, use_pattern_db: bool = True,
+                 use_transposition_table: bool = True, use_walking_distance: bool = True,
+                 weight: float = 1.0, abort: Optional[threading.Event] = None):
         """
         初始化求解器
         
         参数:
             use_linear_conflict: 是否使用线性冲突启发函数
+            use_pattern_db: 是否优先使用模式数据库（棋盘大小支持时生效，
+                            此时不再使用线性冲突）
+            use_transposition_table: 是否使用置换表剪掉重复到达的状态
+            use_walking_distance: 使用线性冲突时，是否再与行走距离取最大值
+                                  （不使用模式数据库、且棋盘大小支持时生效）
+            weight: 启发值的权重（>=1）。大于1时按 f = g + weight*h 搜索，
+                    解的步数最多是最优解的weight倍，但通常快得多
+            abort: 可选，被设置后搜索尽快停止、solve返回None；
+                   用来中止已经用不上的后台预先求解
         """
-        # 选择启发函数
+        # NaN和任何数比较都是False，写成区间判断才能把它一起拒绝
+        if not (1 <= weight < math.inf):
+            raise ValueError("weight 必须是不小于 1 的有限数")
+        
+        # 选择启发函数（模式数据库要等知道棋盘大小后才能决定，见solve）
+        self.use_linear_conflict = use_linear_conflict
+        self.use_pattern_db = use_pattern_db
         self.heuristic = linear_conflict if use_linear_conflict else manhattan_distance
         
         # 统计扩展的节点数（用于调试）
         self.nodes_expanded = 0
+        
+        # 当前求解的棋盘大小、目标棋盘、解的步数奇偶性（在solve中设置）
+        self._size = 0
+        self._goal = b''
+        self._parity = 0
+        
+        # 模式数据库相关（在solve中设置，不使用时为None）
+        # _pdbs: 各组的数据库；_pdb_keys: 工作棋盘当前的各组位置键（随移动增量更新）
+        # _tile_group[t] / _tile_shift[t]: 数字t所在的组号（-1表示不在任何组）和在键中的位移
+        self._pdbs: Optional[List[bytearray]] = None
+        self._pdb_keys: List[int] = []
+        self._tile_group: List[int] = []
+        self._tile_shift: List[int] = []
+        
+        # 置换表：Zobrist哈希 -> 本轮迭代中到达该状态的最小步数g
+        # 同一轮里再次以不小于g的步数到达同一状态时，它的子树已经搜过了，直接剪掉
+        self.use_transposition_table = use_transposition_table
+        self._tt: Dict[int, int] = {}
+        
+        # 行走距离（在solve中设置，不使用时为None）
+        # _wd_keys: 工作棋盘当前的[行键, 列键]，随移动增量更新
+        self.use_walking_distance = use_walking_distance
+        self._wd: Optional[Dict[int, int]] = None
+        self._wd_keys: List[int] = []
+        
+        # 加权搜索的权重（1表示普通的最优IDA*）
+        self.weight = weight
+        
+        self.abort = abort
     
-    def solve(self, initial_state: PuzzleState, max_depth: int = 80) -> Optional[List[Direction]]:
+    def solve(
+        self,
+        initial_state: PuzzleState,
+        max_depth: int = 80,
+        depth_bound: Optional[Callable[[], int]] = None
+    ) -> Optional[List[Direction]]:
         """
         求解数字华容道
         
         参数:
             initial_state: 初始状态
             max_depth: 最大搜索深度（防止无限循环）
+            depth_bound: 可选，每轮迭代前调用，返回当前允许的最大深度；
+                         并行求解时用来在别的分支找到更短的解后提前停止
         
         返回值:
             移动序列（Direction列表），如果无解返回None
@@ -171,111 +636,642 @@ class IDAStar:
         
         self.nodes_expanded = 0
         
+        # 搜索内层不再经过状态对象，直接在一个一维字节数组上原地走一步、递归、
+        # 再走回来；空位下标作为参数传递。这样每个节点只剩下标运算和查表
+        size = initial_state.size
+        flat = bytearray(initial_state.flat)
+        self._size = size
+        self._goal = GOAL_BYTES[size]
+        
+        # 棋盘大小支持时改用模式数据库
+        self._pdbs = load_pattern_dbs(size) if self.use_pattern_db else None
+        
         # 初始阈值设为启发函数的估计值
-        threshold = self.heuristic(initial_state)
+        # 完整的启发函数只在这里算一次，搜索中按每步的变化量增量更新
+        if self._pdbs is not None:
+            self._pdb_keys = _pattern_keys(flat, size)
+            self._tile_group = [-1] * (size * size)
+            self._tile_shift = [0] * (size * size)
+            for group, tiles in enumerate(PATTERN_GROUPS[size]):
+                for i, tile in enumerate(tiles):
+                    self._tile_group[tile] = group
+                    self._tile_shift[tile] = 4 * i
+            h = sum(db[key] for db, key in zip(self._pdbs, self._pdb_keys))
+        else:
+            h = self.heuristic(initial_state)
+        
+        # 线性冲突再配合行走距离：两者都可采纳，搜索中取较大的一个
+        # 递增传递的h仍然是线性冲突的值，行走距离单独用两个键维护
+        self._wd = None
+        if (self._pdbs is None and self.use_linear_conflict and self.use_walking_distance
+                and size in WALKING_DISTANCE_SIZES):
+            if size not in WALKING_DISTANCE:
+                WALKING_DISTANCE[size] = build_walking_distance(size)
+            self._wd = WALKING_DISTANCE[size]
+            self._wd_keys = list(_wd_keys(flat, size))
+        
+        threshold = h if self._wd is None else max(h, walking_distance(initial_state))
         
-        # 用于记录路径的列表
-        path = []
+        # 每走一步恰好有一个数字移动一格，曼哈顿距离的奇偶性就翻转一次，
+        # 所以任何解的步数都和初始曼哈顿距离同奇偶。和它奇偶性不同的阈值不可能
+        # 找到解，阈值直接跳到下一个同奇偶的值（步长2），省掉一半的迭代轮次。
+        # 模式数据库和行走距离每步不一定变1，不跳的话会白白多搜一轮
+        self._parity = manhattan_distance(initial_state) & 1
+        if self.weight == 1:
+            threshold += (threshold - self._parity) & 1
+        else:
+            # 加权时f不再是整数，也没有奇偶性可用
+            threshold *= self.weight
+        
+        # 初始状态的Zobrist哈希，搜索中随移动增量更新
+        zobrist = ZOBRIST[size]
+        zhash = 0
+        for idx, val in enumerate(flat):
+            zhash ^= zobrist[idx][val]
         
         # 迭代加深
-        while threshold <= max_depth:
-            # 进行一次深度优先搜索
-            result = self._search(initial_state, 0, threshold, path, None)
-            
-            if isinstance(result, list):
-                return result  # 找到解！
-            
-            if result == float('inf'):
-                return None  # 无解
-            
-            # 更新阈值为本次搜索遇到的最小超出值
-            threshold = result
+        try:
+            # 加权时阈值是加权后的f，按同样的倍数放宽上限
+            while threshold <= max_depth * self.weight:
+                if depth_bound is not None and threshold > depth_bound():
+                    return None  # 别的分支已经找到不更长的解
+                
+                # 置换表里的g只在同一轮（同一阈值）内可比，每轮开始时清空
+                self._tt.clear()
+                
+                # 进行一次深度优先搜索（找到解时抛出_Found）
+                result = self._search(flat, initial_state.blank_idx, zhash, h, threshold)
+                
+                if result == float('inf'):
+                    return None  # 无解
+                
+                # 更新阈值为本次搜索遇到的最小超出值（再对齐到解的奇偶性）
+                if self.weight == 1:
+                    threshold = result + ((result - self._parity) & 1)
+                else:
+                    threshold = result
+        except _Found as found:
+            # 找到解！搜索内部用方向编号，出口处统一转换成Direction
+            return [CODE_TO_DIRECTION[code] for code in found.path]
+        except _Aborted:
+            return None  # 被中止
         
         return None  # 超出最大深度
     
     def _search(
         self,
-        state: PuzzleState,
-        g: int,              # 从起点到当前状态的实际步数
-        threshold: int,      # 当前阈值
-        path: List[Direction],  # 当前路径
-        last_move: Optional[Direction]  # 上一步的移动方向（用于剪枝）
-    ) -> any:
+        flat: bytearray,     # 工作棋盘（一维，原地修改）
+        blank_idx: int,      # 初始空位下标
+        zhash: int,          # 初始棋盘的Zobrist哈希
+        h: int,              # 初始状态的启发函数值
+        threshold: int       # 当前阈值
+    ) -> float:
         """
-        IDA* 搜索的核心递归函数
+        IDA* 的一轮深度优先搜索（用显式栈代替递归）
+        
+        不再为每个节点创建Python栈帧，也不受递归深度限制。
+        stack里每一层对应路径上的一个已展开节点：
+            (空位下标, Zobrist哈希, 启发值, 还没尝试的方向的迭代器)
+        path[i]是从第i层走到第i+1层的方向编号，g是当前深度；
+        一个节点处理完（或被剪掉）时，按path[g-1]把棋盘退回父节点。
+        path按本轮最大可能深度预先分配好，搜索中不再增删列表元素
         
         返回值:
-            - 如果找到解：返回路径列表
             - 如果超出阈值：返回遇到的最小f值（用于更新阈值）
             - 如果无解：返回 float('inf')
+            找到解时不返回，而是抛出_Found；被abort中止时抛出_Aborted
         """
-        self.nodes_expanded += 1
-        
-        # 计算f值 = g (已走步数) + h (估计剩余步数)
-        f = g + self.heuristic(state)
-        
-        # 如果f值超过阈值，返回f值（用于更新阈值）
-        if f > threshold:
-            return f
-        
-        # 如果达到目标状态，返回当前路径
-        if state.is_goal():
-            return path[:]  # 返回路径的副本
+        size = self._size
+        goal = self._goal
+        neighbor_table = NEIGHBOR_IDX[size]
+        next_codes = NEXT_CODES[size]
+        zobrist = ZOBRIST[size]
+        use_tt = self.use_transposition_table
+        tt = self._tt
+        wd = self._wd
+        wd_keys = self._wd_keys
+        weight = self.weight
+        abort = self.abort
         
         # 记录本次搜索遇到的最小超出值
         min_threshold = float('inf')
         
-        # 尝试所有有效的移动方向
-        for direction in state.get_valid_moves():
-            # 剪枝：不走回头路
-            # 如果上一步向上走，这一步就不要向下走（会回到原来的状态）
-            if last_move is not None and direction == OPPOSITE_DIRECTION[last_move]:
-                continue
-            
-            # 创建新状态（深拷贝，不修改原状态）
-            new_state = state.copy()
-            new_state.move(direction)
-            
-            # 将这一步加入路径
-            path.append(direction)
+        # 深度超过threshold的节点f必然超过阈值，不会再往下走，
+        # 所以路径最长threshold+1步
+        path = bytearray(int(threshold) + 2)
+        g = 0
+        stack = []
+        nodes = 0  # 扩展节点数先用局部变量累计，返回前再写回
+        
+        while True:
+            # ---------- 处理当前节点 (blank_idx, zhash, h) ----------
+            nodes += 1
+            if abort is not None and not nodes & ABORT_CHECK_MASK and abort.is_set():
+                self.nodes_expanded += nodes
+                raise _Aborted
             
-            # 递归搜索
-            result = self._search(new_state, g + 1, threshold, path, direction)
+            # 计算f值 = g (已走步数) + h (估计剩余步数)
+            f = g + h
+            if wd is not None:
+                # 行走距离更紧时用它
+                h_wd = wd[wd_keys[0]] + wd[wd_keys[1]]
+                if h_wd > h:
+                    f = g + h_wd
+            if weight != 1:
+                f = g + (f - g) * weight
             
-            # 回溯：移除这一步
-            path.pop()
+            expand = True
+            if f > threshold:
+                # f值超过阈值，记下最小超出值（用于更新阈值）
+                if f < min_threshold:
+                    min_threshold = f
+                expand = False
+            elif flat == goal:
+                # 达到目标状态，带着当前路径跳出搜索
+                self.nodes_expanded += nodes
+                raise _Found(list(path[:g]))
+            elif use_tt:
+                # 置换表：本轮已经以更少（或相同）的步数到达过这个状态，
+                # 它的子树搜过了，这里再搜不会有更好的结果
+                seen_g = tt.get(zhash)
+                if seen_g is not None and seen_g <= g:
+                    expand = False
+                else:
+                    if len(tt) >= TRANSPOSITION_TABLE_SIZE:
+                        tt.clear()  # 置换表只用来剪枝，清空只会少剪一些，不影响正确性
+                    tt[zhash] = g
             
-            # 如果找到解，直接返回
-            if isinstance(result, list):
-                return result
+            if expand:
+                # 剪枝：不走回头路
+                # 如果上一步向上走，这一步就不要向下走（会回到原来的状态）
+                # NEXT_CODES已经按上一步去掉了反方向，查一次表就是要尝试的全部方向
+                last_move = path[g - 1] if g else NO_LAST_MOVE
+                stack.append((blank_idx, zhash, h, iter(next_codes[blank_idx][last_move])))
+            elif g:
+                # 叶子节点：直接退回父节点
+                parent_blank = stack[-1][0]
+                self._unmake_move(flat, parent_blank, blank_idx)
+                g -= 1
             
-            # 更新最小超出值
-            if result < min_threshold:
-                min_threshold = result
+            # ---------- 找下一个要进入的子节点 ----------
+            while stack:
+                parent_blank, parent_zhash, parent_h, codes = stack[-1]
+                code = next(codes, -1)
+                
+                if code >= 0:
+                    # 原地走一步（不再拷贝状态），同时得到新的启发值
+                    # 走完之后空位在tile_idx
+                    tile_idx = neighbor_table[parent_blank][code]
+                    
+                    # 子状态的哈希：数字tile从tile_idx移到原空位，空位反过来
+                    tile = flat[tile_idx]
+                    z_blank = zobrist[parent_blank]
+                    z_tile = zobrist[tile_idx]
+                    zhash = parent_zhash ^ z_blank[0] ^ z_blank[tile] ^ z_tile[tile] ^ z_tile[0]
+                    
+                    # 子节点的深度是g+1，h超过(threshold-g-1)/weight就一定会被剪掉
+                    bound = threshold - g - 1
+                    if weight != 1:
+                        bound /= weight
+                    h = self._make_move(flat, parent_blank, tile_idx, code, parent_h, bound)
+                    blank_idx = tile_idx
+                    
+                    # 将这一步加入路径
+                    path[g] = code
+                    g += 1
+                    break
+                
+                # 这个节点的方向都试完了：出栈，并把棋盘退回它的父节点
+                stack.pop()
+                if g:
+                    self._unmake_move(flat, stack[-1][0], parent_blank)
+                    g -= 1
+            else:
+                # 栈空：整棵树搜完
+                self.nodes_expanded += nodes
+                return min_threshold
+    
+    def _make_move(self, flat: bytearray, blank_idx: int, tile_idx: int, code: int, h: int,
+                   bound: int) -> int:
+        """
+        原地执行一步移动，并增量算出移动后的启发值
+        
+        曼哈顿距离只有被移动的数字变了；线性冲突方面，上下移动时数字换了行，
+        只影响它离开和进入的两行（所在列里数字的先后顺序不变），
+        左右移动同理只影响两列
+        
+        撤销移动只需把两个格子换回来，旧的h由调用者保存
         
-        return min_threshold
+        去掉两条线的旧冲突、加上曼哈顿距离的变化之后，剩下的值已经是新启发值的
+        下界。它超过bound时这个子节点反正要被剪掉，就直接返回这个下界，
+        不再计算两条线的新冲突。所有f值都和阈值同奇偶，下界超过阈值时至少也是
+        阈值+2，用它更新下一轮阈值和用完整的h结果一样
+        
+        参数:
+            flat: 工作棋盘（原地修改）
+            blank_idx: 移动前的空位下标
+            tile_idx: 被移动数字的位置（也就是移动后的空位）
+            code: 空位的移动方向编号（必须有效）
+            h: 移动前的启发值
+            bound: 子节点不被剪掉时h的最大值（threshold - 子节点的g）
+        
+        返回值:
+            移动后的启发值（超过bound时可能只是一个下界）
+        """
+        size = self._size
+        
+        if self._pdbs is not None:
+            # 模式数据库：只有被移动数字所在的那一组的键会变
+            tile = flat[tile_idx]
+            group = self._tile_group[tile]
+            if group >= 0:
+                db = self._pdbs[group]
+                old_key = self._pdb_keys[group]
+                new_key = old_key + ((blank_idx - tile_idx) << self._tile_shift[tile])
+                self._pdb_keys[group] = new_key
+                h += db[new_key] - db[old_key]
+            flat[blank_idx] = tile
+            flat[tile_idx] = 0
+            return h
+        
+        # 被移动的数字从tile_idx移到原来的空位（即manhattan_delta，这里内联查表）
+        md = MANHATTAN[size][flat[tile_idx]]
+        h += md[blank_idx] - md[tile_idx]
+        
+        if not self.use_linear_conflict:
+            flat[blank_idx] = flat[tile_idx]
+            flat[tile_idx] = 0
+            return h
+        
+        if code <= DIR_DOWN:
+            # 上下移动：数字换行，重算两行
+            line_conflict = _row_conflict
+            a, b = tile_idx // size, blank_idx // size
+        else:
+            # 左右移动：数字换列，重算两列
+            line_conflict = _col_conflict
+            a, b = tile_idx % size, blank_idx % size
+        
+        if self._wd is not None:
+            self._update_wd_key(flat[tile_idx], code, a, b)
+        
+        # 先减去这两条线移动前的冲突，移动后再加上新的冲突
+        h -= line_conflict(flat, size, a) + line_conflict(flat, size, b)
+        flat[blank_idx] = flat[tile_idx]
+        flat[tile_idx] = 0
+        if h > bound:
+            return h  # 只靠下界就能剪枝
+        return h + line_conflict(flat, size, a) + line_conflict(flat, size, b)
+    
+    def _unmake_move(self, flat: bytearray, blank_idx: int, tile_idx: int):
+        """
+        撤销_make_move：把数字从blank_idx换回tile_idx
+        
+        参数:
+            flat: 工作棋盘（原地修改）
+            blank_idx: 撤销后的空位下标（也就是_make_move之前的空位）
+            tile_idx: 撤销前的空位下标
+        """
+        tile = flat[blank_idx]
+        flat[tile_idx] = tile
+        flat[blank_idx] = 0
+        
+        # 模式数据库的位置键也要换回去
+        if self._pdbs is not None:
+            group = self._tile_group[tile]
+            if group >= 0:
+                self._pdb_keys[group] += (tile_idx - blank_idx) << self._tile_shift[tile]
+        
+        # 行走距离的键同理：把数字从blank_idx所在的行/列挪回tile_idx所在的行/列
+        elif self._wd is not None:
+            size = self._size
+            if abs(tile_idx - blank_idx) == size:
+                self._update_wd_key(tile, 0, blank_idx // size, tile_idx // size)
+            else:
+                self._update_wd_key(tile, DIR_DOWN + 1, blank_idx % size, tile_idx % size)
+    
+    def _update_wd_key(self, tile: int, code: int, src: int, dst: int):
+        """
+        数字tile从第src行（列）移到第dst行（列）后，更新行走距离的键
+        
+        空位反过来从dst移到src。上下移动只改变行键，左右移动只改变列键
+        
+        参数:
+            tile: 被移动的数字
+            code: 方向编号（只用来区分上下还是左右）
+            src: 数字原来所在的行（列），也就是移动后空位所在的行（列）
+            dst: 数字移动后所在的行（列）
+        """
+        size = self._size
+        if code <= DIR_DOWN:
+            which, goal = 0, GOAL_ROW[size][tile]
+        else:
+            which, goal = 1, GOAL_COL[size][tile]
+        self._wd_keys[which] += ((1 << _wd_shift(size, dst, goal))
+                                 - (1 << _wd_shift(size, src, goal))
+                                 + ((src - dst) << (3 * size * size)))
+
+
+# ==================== 3x3完整距离表 ====================
+# 3x3只有 9!/2 = 181440 个可解状态，从目标状态BFS一遍就能得到每个状态的
+# 最少步数（不到一秒），之后任何3x3题目都只需查表走下坡路，不用搜索
+
+# _DISTANCE_3X3: {棋盘bytes: 到目标的最少步数}，首次使用时构建
+_DISTANCE_3X3: Optional[Dict[bytes, int]] = None
+
+
+def build_distance_table_3x3() -> Dict[bytes, int]:
+    """
+    用PuzzleFrontier从目标状态逐层BFS，得到所有可解3x3状态的最少步数
+    
+    返回值:
+        {棋盘bytes: 最少步数}
+    """
+    goal = get_goal_state(3)
+    seen = {goal.to_tuple()}
+    table = {goal.to_tuple(): 0}
+    
+    frontier = PuzzleFrontier.from_states([goal])
+    depth = 0
+    while len(frontier):
+        depth += 1
+        frontier = frontier.expand_all(seen)
+        for i in range(len(frontier)):
+            table[frontier.get_board(i)] = depth
+    
+    return table
+
+
+def load_distance_table_3x3() -> Dict[bytes, int]:
+    """
+    取得3x3完整距离表（首次调用时构建，之后直接返回）
+    
+    返回值:
+        {棋盘bytes: 最少步数}
+    """
+    global _DISTANCE_3X3
+    if _DISTANCE_3X3 is None:
+        with _table_lock('distance', 3):
+            if _DISTANCE_3X3 is None:
+                _DISTANCE_3X3 = build_distance_table_3x3()
+    return _DISTANCE_3X3
+
+
+def solve_3x3(state: PuzzleState) -> Optional[List[Direction]]:
+    """
+    查表求解3x3（最优解）
+    
+    每一步都走到距离恰好少1的邻居，一直走到目标
+    
+    参数:
+        state: 3x3初始状态
+    
+    返回值:
+        移动序列，如果无解返回None
+    """
+    table = load_distance_table_3x3()
+    
+    flat = bytearray(state.flat)
+    dist = table.get(bytes(flat))
+    if dist is None:
+        return None  # 不在表里说明无解
+    
+    blank_idx = state.blank_idx
+    neighbor_idx = NEIGHBOR_IDX[3]
+    path = []
+    
+    while dist > 0:
+        for code in NEXT_CODES[3][blank_idx][NO_LAST_MOVE]:
+            tile_idx = neighbor_idx[blank_idx][code]
+            flat[blank_idx] = flat[tile_idx]
+            flat[tile_idx] = 0
+            if table[bytes(flat)] == dist - 1:
+                break  # 这一步是下坡路
+            # 不是，换回来试下一个方向
+            flat[tile_idx] = flat[blank_idx]
+            flat[blank_idx] = 0
+        
+        path.append(CODE_TO_DIRECTION[code])
+        blank_idx = tile_idx
+        dist -= 1
+    
+    return path
+
+
+# ==================== 并行求解 ====================
+# 根节点最多有4个方向，每个方向下面是互不相交的子树，可以分给多个进程
+# （绕开GIL）各自跑IDA*。为了保证最优，各进程共享"目前找到的最短解长度"，
+# 阈值超过它的分支直接放弃，最后取所有分支里最短的解
+
+# 根节点启发值低于这个数时不开进程：开进程、每个进程重建查找表要一秒左右，
+# 简单的题串行早就解完了（例如tests/test2.txt启发值42、解54步，串行0.8s，
+# 4个进程2.1s）；启发值到这里的题串行要几十秒，这点开销才划算
+PARALLEL_MIN_HEURISTIC = 48
+
+# 工作进程中共享的最短解长度（由进程池的initializer设置）
+_shared_best = None
+
+
+def _init_branch_worker(best):
+    """进程池initializer：保存共享的最短解长度"""
+    global _shared_best
+    _shared_best = best
+
+
+def _solve_branch(
+    flat: bytes,
+    size: int,
+    code: int,
+    use_linear_conflict: bool,
+    use_pattern_db: bool
+) -> Optional[List[int]]:
+    """
+    工作进程：固定第一步为code，求解剩下的子树
+    
+    参数:
+        flat: 根状态的一维棋盘
+        size: 棋盘大小
+        code: 固定的第一步方向编号
+        use_linear_conflict: 是否使用线性冲突
+        use_pattern_db: 是否优先使用模式数据库
+    
+    返回值:
+        完整解的方向编号序列（包含第一步），没有更短的解时返回None
+    """
+    # 工作进程是新启动的，查找表还没建：走普通构造函数（会先建表）
+    state = PuzzleState([list(flat[i:i + size]) for i in range(0, size * size, size)])
+    state.move_code(code)
+    
+    solver = IDAStar(use_linear_conflict=use_linear_conflict, use_pattern_db=use_pattern_db)
+    # 子树里的解再加上第一步，总长度必须严格短于目前的最短解
+    solution = solver.solve(state, depth_bound=lambda: _shared_best.value - 2)
+    if solution is None:
+        return None
+    
+    path = [code] + [DIRECTION_TO_CODE[d] for d in solution]
+    with _shared_best.get_lock():
+        if len(path) < _shared_best.value:
+            _shared_best.value = len(path)
+    return path
+
+
+def solve_puzzle_parallel(
+    state: PuzzleState,
+    use_linear_conflict: bool = True,
+    use_pattern_db: bool = True,
+    max_workers: Optional[int] = None,
+    weight: float = 1.0
+) -> Optional[List[Direction]]:
+    """
+    按根节点的各个方向多进程并行求解（结果仍是最优解）
+    
+    只有一个CPU、加权搜索、或者题目简单（根节点启发值低于PARALLEL_MIN_HEURISTIC）时
+    直接串行求解。加权搜索的阈值是加权后的f，不能和各分支的解长度比较
+    
+    参数:
+        state: 初始状态
+        use_linear_conflict: 是否使用线性冲突优化
+        use_pattern_db: 是否优先使用模式数据库
+        max_workers: 最多使用的进程数，默认每个方向一个
+        weight: 启发值的权重（见IDAStar），不为1时串行求解
+    
+    返回值:
+        移动序列，如果无解返回None
+    """
+    if state.is_goal():
+        return []
+    
+    # 3x3直接查表，不值得开进程
+    if state.size == 3:
+        return solve_3x3(state)
+    
+    if weight != 1 or (os.cpu_count() or 1) < 2:
+        return solve_puzzle(state, use_linear_conflict, use_pattern_db, weight)
+    
+    # 在主进程里先把模式数据库准备好，避免每个工作进程各自构建一遍
+    if use_pattern_db and load_pattern_dbs(state.size) is not None:
+        h = pattern_db_heuristic(state)
+    else:
+        h = linear_conflict(state) if use_linear_conflict else manhattan_distance(state)
+    if h < PARALLEL_MIN_HEURISTIC:
+        return solve_puzzle(state, use_linear_conflict, use_pattern_db)
+    
+    # 不用fork启动工作进程：Solver里还有预热和预先求解的线程，fork时别的线程
+    # 可能正持有某张表的锁，子进程里那把锁永远不会被释放。forkserver/spawn
+    # 从干净的进程开始，工作进程从磁盘读取模式数据库
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+    else:
+        context = multiprocessing.get_context('spawn')  # Windows只有spawn
+    
+    codes = state.get_valid_codes()
+    best = context.Value('i', 1 << 30)
+    best_path = None
+    
+    with ProcessPoolExecutor(
+        max_workers=max_workers or len(codes),
+        mp_context=context,
+        initializer=_init_branch_worker,
+        initargs=(best,)
+    ) as pool:
+        futures = [
+            pool.submit(_solve_branch, bytes(state.flat), state.size, code,
+                        use_linear_conflict, use_pattern_db)
+            for code in codes
+        ]
+        for future in as_completed(futures):
+            path = future.result()
+            if path is not None and (best_path is None or len(path) < len(best_path)):
+                best_path = path
+    
+    if best_path is None:
+        return None
+    return [CODE_TO_DIRECTION[code] for code in best_path]
+
+
+# ==================== 预热 ====================
+
+# 模式数据库、3x3距离表和目标表可能同时被后台预热线程和求解请求用到，
+# 构建时持有对应的锁，保证每张表只构建一次。每种表、每个大小各一把锁：
+# 预热线程构建4x4模式数据库的几秒里，用别的表的求解不用跟着等
+_TABLE_LOCKS: Dict[Tuple[str, int], threading.Lock] = {}
+_TABLE_LOCKS_GUARD = threading.Lock()  # 保护_TABLE_LOCKS本身，只在取锁时短暂持有
+
+
+def _table_lock(kind: str, size: int) -> threading.Lock:
+    """
+    取得某种表、某个大小专用的锁（第一次用到时创建）
+    
+    参数:
+        kind: 表的种类，例如 'pdb'、'goal'、'distance'
+        size: 棋盘大小
+    
+    返回值:
+        这张表的锁
+    """
+    with _TABLE_LOCKS_GUARD:
+        lock = _TABLE_LOCKS.get((kind, size))
+        if lock is None:
+            lock = _TABLE_LOCKS[(kind, size)] = threading.Lock()
+        return lock
+
+
+def prewarm(use_linear_conflict: bool = True, use_pattern_db: bool = True):
+    """
+    预先准备求解要用的表，让第一次求解不用再等
+    
+    包括3x3完整距离表，以及按设置选择的4x4模式数据库（首次构建约半分钟）
+    或行走距离表。适合在等待网络连接时放在后台线程里调用
+    
+    参数:
+        use_linear_conflict: 是否使用线性冲突优化（决定是否需要行走距离表）
+        use_pattern_db: 是否使用模式数据库
+    """
+    load_distance_table_3x3()
+    for size in PATTERN_GROUPS:
+        if size == 3:
+            continue  # 3x3直接查距离表
+        if use_pattern_db:
+            load_pattern_dbs(size)
+        elif use_linear_conflict and size in WALKING_DISTANCE_SIZES and size not in WALKING_DISTANCE:
+            WALKING_DISTANCE[size] = build_walking_distance(size)
 
 
 # ==================== 简化接口 ====================
 
-def solve_puzzle(state: PuzzleState, use_linear_conflict: bool = True) -> Optional[List[Direction]]:
+def solve_puzzle(
+    state: PuzzleState,
+    use_linear_conflict: bool = True,
+    use_pattern_db: bool = True,
+    weight: float = 1.0,
+    abort: Optional[threading.Event] = None
+) -> Optional[List[Direction]]:
     """
     求解数字华容道（简化接口）
     
     参数:
         state: 初始状态
         use_linear_conflict: 是否使用线性冲突优化
+        use_pattern_db: 是否优先使用模式数据库
+        weight: 启发值的权重，大于1时换取速度、不再保证最优（3x3总是最优）
+        abort: 可选，被设置后尽快停止搜索并返回None（见IDAStar）
     
     返回值:
         移动序列，如果无解返回None
     """
-    solver = IDAStar(use_linear_conflict=use_linear_conflict)
+    # 3x3直接查完整距离表
+    if state.size == 3:
+        return solve_3x3(state)
+    
+    solver = IDAStar(use_linear_conflict=use_linear_conflict, use_pattern_db=use_pattern_db,
+                     weight=weight, abort=abort)
     return solver.solve(state)
 
 
 def get_next_move(
     state: PuzzleState,
-    use_linear_conflict: bool = True
+    use_linear_conflict: bool = True,
+    use_pattern_db: bool = True
 ) -> Optional[Direction]:
     """
     获取下一步移动（只返回第一步）
@@ -283,6 +1279,7 @@ def get_next_move(
     参数:
         state: 当前状态
         use_linear_conflict: 是否使用线性冲突优化
+        use_pattern_db: 是否优先使用模式数据库
     
     返回值:
         下一步移动方向，如果已完成或无解返回None
@@ -290,7 +1287,7 @@ def get_next_move(
     if state.is_goal():
         return None
     
-    solution = solve_puzzle(state, use_linear_conflict)
+    solution = solve_puzzle(state, use_linear_conflict, use_pattern_db)
     
     if solution and len(solution) > 0:
         return solution[0]
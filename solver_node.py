@@ -9,11 +9,16 @@
 """
 
 # ==================== 导入模块 ====================
+import sys                              # 标准输出，用于写日志
 import socket                           # 网络通信库，用于连接UI服务器
+import selectors                        # I/O多路复用，同时等待socket和唤醒信号
+import signal                           # 收到SIGTERM时让主循环正常退出
 import argparse                         # 命令行参数解析库
-import time                             # 时间相关功能，用于计算耗时
-from datetime import datetime           # 日期时间处理，用于日志时间戳
-from typing import Optional             # 类型提示
+import threading                        # 后台线程，用于连接时预热求解器
+import time                             # 时间相关功能，用于计算耗时和日志时间戳
+from collections import deque           # 双端队列，用作日志的环形缓冲区
+from concurrent.futures import ThreadPoolExecutor, Future  # 后台线程，用于对手回合时预先求解
+from typing import Optional, List, Dict, Tuple  # 类型提示
 
 # 从公共模块导入
 from common import (
@@ -24,11 +29,44 @@ from common import (
     send_message,          # 发送消息的函数
     recv_message,          # 接收消息的函数
     is_solvable,           # 判断是否可解
-    DEFAULT_PORT           # 默认端口号
+    DEFAULT_PORT,          # 默认端口号
+    BUFFER_SIZE,           # 网络缓冲区大小
+    LOCAL_HOSTS,           # 表示本机的地址
+    unix_socket_path       # 本机Unix域套接字路径
 )
 
 # 从求解算法模块导入
-from solver import solve_puzzle, get_next_move
+from solver import solve_puzzle, solve_puzzle_parallel, get_next_move, prewarm
+
+
+# ==================== 日志 ====================
+
+# 日志级别对应的图标（输出到终端时使用）
+LOG_PREFIX_TTY = {
+    "INFO": "ℹ️ ",      # 普通信息
+    "SEND": "📤",       # 发送消息
+    "RECV": "📥",       # 接收消息
+    "SUCCESS": "✅",    # 成功
+    "ERROR": "❌",      # 错误
+    "CALC": "🧮"        # 计算中
+}
+
+# 输出被重定向到文件/管道时改用纯ASCII前缀，省掉多字节编码，日志文件也更好grep
+LOG_PREFIX_PLAIN = {
+    "INFO": "i",
+    "SEND": ">",
+    "RECV": "<",
+    "SUCCESS": "OK",
+    "ERROR": "!!",
+    "CALC": "C"
+}
+
+# 每条消息收发的日志（每一步都有好几条）：非verbose模式下不打印，只缓存起来，
+# 出错时连同错误一起打印作为上下文；其余级别的日志总是立即打印
+LOG_QUIET_LEVELS = ("SEND", "RECV")
+
+# 非verbose模式下最多缓存的收发日志条数（超出后丢弃最早的）
+LOG_BUFFER_SIZE = 1000
 
 
 # ==================== 计算节点类 ====================
@@ -39,7 +77,9 @@ class SolverNode:
     负责连接UI服务器，接收状态，计算并发送移动指令
     """
     
-    def __init__(self, solver_id: int, host: str, port: int, use_linear_conflict: bool = True):
+    def __init__(self, solver_id: int, host: str, port: int, use_linear_conflict: bool = True,
+                 use_pattern_db: bool = True, workers: int = 1, speculate: bool = True,
+                 verbose: bool = False, weight: float = 1.0):
         """
         构造函数：初始化计算节点
         
@@ -48,6 +88,11 @@ class SolverNode:
             host: UI程序的IP地址
             port: UI程序的端口号
             use_linear_conflict: 是否使用线性冲突优化（更高效的启发函数）
+            use_pattern_db: 是否优先使用模式数据库（3x3/4x4棋盘上最快）
+            workers: 求解进程数，大于1时按根节点的各个方向并行搜索
+            speculate: 是否在对手回合时，预先在后台求解对手各种走法之后的局面
+            verbose: 是否也打印每条消息的收发日志（否则只在出错时作为上下文打印）
+            weight: 启发值的权重，大于1时更快但解不一定最短
         """
         # 验证ID是否有效
         if solver_id not in [1, 2]:
@@ -58,40 +103,94 @@ class SolverNode:
         self.host = host
         self.port = port
         self.use_linear_conflict = use_linear_conflict
+        self.use_pattern_db = use_pattern_db
+        self.workers = workers
+        self.weight = weight
         
         # socket连接对象，初始为None
         self.socket: Optional[socket.socket] = None
         
+        # 接收缓冲区，所有消息都读进这一块内存（消息很小，一般放得下）
+        self._rx_buf = bytearray(BUFFER_SIZE)
+        
         # 运行状态标志
         self.running = False
         
+        # 主循环用selector同时等待UI的消息和唤醒信号（在run中创建）。
+        # 唤醒用一对socket而不是os.pipe，因为Windows上的select只支持socket
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wake_r: Optional[socket.socket] = None
+        self._wake_w: Optional[socket.socket] = None
+        
         # 当前棋盘状态
         self.current_state: Optional[PuzzleState] = None
+        
+        # 收发日志的缓冲区：每一步都有好几条，非verbose模式下只记下
+        # (时间戳, 级别, 内容)，格式化和print推迟到出错需要输出的时候
+        self.verbose = verbose
+        self._log_buf = deque(maxlen=LOG_BUFFER_SIZE)
+        self._prefix = LOG_PREFIX_TTY if sys.stdout.isatty() else LOG_PREFIX_PLAIN
+        
+        # 缓存的完整解法：cached_plan[i]是在第i个状态上要走的方向，
+        # _plan_index把解法路径上每个状态（to_tuple()）映射到它的下标。
+        # 最优解的任意后缀仍是最优解，所以只要当前状态还在路径上，
+        # 不管中间另一个Solver走了几步，都可以直接接着走，不必重新搜索
+        self.cached_plan: List[Direction] = []
+        self._plan_index: Dict[object, int] = {}
+        
+        # 预先求解：发出移动后到下次轮到自己之间，主线程只是阻塞在recv上
+        # （不占GIL），这段时间在后台线程里把对手每种可能走法之后、
+        # 不在缓存路径上的局面先解出来。键是局面的to_tuple()，
+        # 值是(future, abort)：abort用来中止已经开始、但用不上了的搜索
+        self.speculate = speculate
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._speculative: Dict[object, Tuple[Future, threading.Event]] = {}
     
     def _log(self, message: str, level: str = "INFO"):
         """
-        打印日志到控制台
+        记录一条日志
+        
+        收发日志（LOG_QUIET_LEVELS）在非verbose模式下只放进缓冲区，
+        出错时再连同错误一起打印；其余日志（连接、计算结果、完成等）总是立即打印
         
         参数:
             message: 日志内容
             level: 日志级别（INFO, SEND, RECV, SUCCESS, ERROR, CALC）
         """
-        # 获取当前时间
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # 根据级别选择图标
-        prefix = {
-            "INFO": "ℹ️ ",      # 普通信息
-            "SEND": "📤",       # 发送消息
-            "RECV": "📥",       # 接收消息
-            "SUCCESS": "✅",    # 成功
-            "ERROR": "❌",      # 错误
-            "CALC": "🧮"        # 计算中
-        }.get(level, "")        # .get() 方法在键不存在时返回默认值""
-        
-        # 格式化输出
-        # :^7 表示居中对齐，宽度为7
-        print(f"[{timestamp}] [{level:^7}] {prefix} {message}")
+        entry = (time.time(), level, message)
+        if level not in LOG_QUIET_LEVELS:
+            # 出错时先打印缓存的收发日志，看得到出错前发生了什么
+            if level == "ERROR" and self._log_buf:
+                self._write_log(self._log_buf, flush=False)
+                self._log_buf.clear()
+            self._write_log((entry,), flush=True)
+        elif self.verbose:
+            self._write_log((entry,), flush=False)
+        else:
+            self._log_buf.append(entry)
+    
+    def _write_log(self, entries, flush: bool):
+        """
+        把日志格式化后写到标准输出
+        
+        参数:
+            entries: (时间戳, 级别, 内容) 的可迭代对象
+            flush: 是否立即刷新标准输出（收发日志不需要）
+        """
+        lines = []
+        for timestamp, level, message in entries:
+            # 根据级别选择图标
+            # .get() 方法在键不存在时返回默认值""
+            prefix = self._prefix.get(level, "")
+            
+            # 格式化输出
+            # :^7 表示居中对齐，宽度为7
+            clock = time.strftime("%H:%M:%S", time.localtime(timestamp))
+            lines.append(f"[{clock}] [{level:^7}] {prefix} {message}\n")
+        
+        sys.stdout.write("".join(lines))
+        if flush:
+            sys.stdout.flush()
     
     def connect(self) -> bool:
         """
@@ -101,12 +200,16 @@ class SolverNode:
             True表示连接成功，False表示失败
         """
         try:
-            # 创建TCP socket
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            # 在后台准备求解要用的表（首次构建模式数据库约半分钟），
+            # 和连接握手、等待游戏开始的时间重叠
+            threading.Thread(
+                target=prewarm,
+                args=(self.use_linear_conflict, self.use_pattern_db),
+                daemon=True
+            ).start()
             
-            # 连接到服务器
-            # connect()函数接受一个元组 (host, port)
-            self.socket.connect((self.host, self.port))
+            # 连接到服务器（本机优先用Unix域套接字）
+            self.socket = self._open_socket()
             
             self._log(f"正在连接到 {self.host}:{self.port}...")
             
@@ -119,7 +222,7 @@ class SolverNode:
             self._log(f"发送连接请求 (Solver {self.solver_id})", "SEND")
             
             # 等待服务器的欢迎响应
-            response = recv_message(self.socket)
+            response = recv_message(self.socket, self._rx_buf)
             
             # 检查是否收到WELCOME消息
             if response and response.msg_type == MessageType.WELCOME:
@@ -133,6 +236,35 @@ class SolverNode:
             self._log(f"连接失败: {str(e)}", "ERROR")
             return False
     
+    def _open_socket(self) -> socket.socket:
+        """
+        建立到UI的连接
+        
+        UI在本机时先尝试Unix域套接字，UI没有监听（旧版本或系统不支持）时退回TCP
+        
+        返回值:
+            已连接的socket
+        """
+        if self.host in LOCAL_HOSTS and hasattr(socket, 'AF_UNIX'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(unix_socket_path(self.port))
+                return sock
+            except OSError:
+                sock.close()
+        
+        # 创建TCP socket
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        
+        # 消息都很小，关掉Nagle算法，否则每条消息可能被延迟几十毫秒才发出
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # 空闲时保持连接（一局之间可能等很久）
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        
+        # connect()函数接受一个元组 (host, port)
+        sock.connect((self.host, self.port))
+        return sock
+    
     def run(self):
         """
         运行主循环
@@ -145,19 +277,31 @@ class SolverNode:
         self.running = True
         self._log("等待游戏开始...")
         
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self.socket, selectors.EVENT_READ)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        
         try:
-            # 主循环：持续接收和处理消息
+            # 主循环：等到有消息（或被stop唤醒）再处理
             while self.running:
-                # 接收消息（会阻塞直到收到）
-                msg = recv_message(self.socket)
-                
-                if not msg:
-                    # 收到None说明连接断开
-                    self._log("连接已断开", "ERROR")
-                    break
-                
-                # 处理消息
-                self._handle_message(msg)
+                # 带超时，这样Windows上也能及时响应Ctrl+C
+                for key, _ in self._selector.select(timeout=0.5):
+                    if key.fileobj is self._wake_r:
+                        self._wake_r.recv(64)  # 只是唤醒信号，读掉即可
+                        continue
+                    
+                    # socket可读：接收一条完整的消息
+                    msg = recv_message(self.socket, self._rx_buf)
+                    
+                    if not msg:
+                        # 收到None说明连接断开
+                        self._log("连接已断开", "ERROR")
+                        self.running = False
+                        break
+                    
+                    # 处理消息
+                    self._handle_message(msg)
         
         except KeyboardInterrupt:
             # 用户按Ctrl+C中断
@@ -168,6 +312,17 @@ class SolverNode:
             # 无论如何都要清理资源
             self._cleanup()
     
+    def stop(self):
+        """
+        让主循环退出（可以在其他线程或信号处理函数中调用）
+        """
+        self.running = False
+        if self._wake_w is not None:
+            try:
+                self._wake_w.send(b'x')
+            except OSError:
+                pass  # 主循环已经退出并关闭了唤醒socket
+    
     def _handle_message(self, msg: Message):
         """
         处理接收到的消息
@@ -178,8 +333,11 @@ class SolverNode:
         
         if msg.msg_type == MessageType.STATE:
             # 收到棋盘状态更新
-            # 从消息中的board_data创建PuzzleState对象
-            self.current_state = PuzzleState(msg.board_data)
+            # 从消息中的棋盘创建状态对象
+            if msg.board_flat is not None:
+                self.current_state = PuzzleState.from_flat(msg.board_flat)
+            else:
+                self.current_state = PuzzleState.from_board(msg.board_data)
             step = msg.step_num
             self._log(f"收到棋盘状态 (当前步数: {step})", "RECV")
         
@@ -191,13 +349,15 @@ class SolverNode:
         
         elif msg.msg_type == MessageType.SOLVED:
             # 游戏完成
-            self._log(f"🎉 游戏完成！总步数: {msg.total_steps}", "SUCCESS")
+            self._log(f"游戏完成！总步数: {msg.total_steps}", "SUCCESS")
+            self._clear_plan()
             self._log("等待新游戏...", "INFO")
             # 注意：不设置running=False，继续等待新游戏
         
         elif msg.msg_type == MessageType.NOSOLUTION:
             # 题目无解
             self._log("题目无解", "ERROR")
+            self._clear_plan()
             self._log("等待新题目...", "INFO")
         
         elif msg.msg_type == MessageType.ERROR:
@@ -209,8 +369,9 @@ class SolverNode:
         计算并发送下一步移动
         
         这是核心逻辑：
-        1. 使用IDA*算法计算完整解法
-        2. 只发送第一步（下一步）
+        1. 当前状态在缓存的解法路径上时直接取下一步
+        2. 否则使用IDA*算法计算完整解法并缓存
+        3. 只发送第一步（下一步）
         """
         # 检查是否有棋盘状态
         if not self.current_state:
@@ -222,22 +383,42 @@ class SolverNode:
             self._log("棋盘已经是目标状态", "INFO")
             return
         
-        # 使用IDA*算法计算解法
-        # time.time()返回当前时间戳（秒）
-        start_time = time.time()
-        solution = solve_puzzle(self.current_state, self.use_linear_conflict)
-        elapsed = time.time() - start_time
-        
-        # 检查是否找到解法
-        if not solution or len(solution) == 0:
-            self._log("无法找到解法", "ERROR")
-            return
-        
-        # 记录计算结果
-        self._log(f"计算完成！当前需 {len(solution)} 步，耗时 {elapsed:.3f}s", "CALC")
-        
-        # 只取第一步（solution[0]）
-        direction = solution[0]
+        # 当前状态在缓存的解法路径上：直接接着走
+        key = self.current_state.to_tuple()
+        index = self._plan_index.get(key)
+        if index is not None:
+            direction = self.cached_plan[index]
+            self._log(f"沿用缓存的解法，还需 {len(self.cached_plan) - index} 步", "CALC")
+        else:
+            # 后台已经（或正在）为这个局面求解时直接取结果；
+            # 还在排队的不等它（单线程池里前面可能还有别的预测），直接求解。
+            # 其余预测先中止：排队的取消，正在跑的通过abort让它尽快停下，
+            # 免得和这里的求解抢GIL、也免得占着唯一的后台线程
+            # time.time()返回当前时间戳（秒）
+            start_time = time.time()
+            entry = self._speculative.pop(key, None)
+            self._cancel_speculation()
+            future = entry[0] if entry is not None else None
+            if future is not None and (future.running() or future.done()) and not future.cancelled():
+                solution = future.result()
+            else:
+                if entry is not None:
+                    future.cancel()
+                    entry[1].set()
+                solution = self._solve(self.current_state)
+            elapsed = time.time() - start_time
+            
+            # 检查是否找到解法
+            if not solution or len(solution) == 0:
+                self._log("无法找到解法", "ERROR")
+                return
+            
+            # 记录计算结果
+            self._log(f"计算完成！当前需 {len(solution)} 步，耗时 {elapsed:.3f}s", "CALC")
+            self._cache_plan(solution)
+            
+            # 只取第一步（solution[0]）
+            direction = solution[0]
         
         # 创建移动消息
         move_msg = Message(
@@ -250,6 +431,85 @@ class SolverNode:
         send_message(self.socket, move_msg)
         
         self._log(f"发送移动: {direction.value}", "SEND")
+        
+        if self.speculate:
+            self._speculate(direction)
+    
+    def _solve(self, state: PuzzleState) -> Optional[List[Direction]]:
+        """
+        求解给定局面（按设置选择串行或多进程并行）
+        
+        参数:
+            state: 要求解的局面
+        
+        返回值:
+            移动序列，如果无解返回None
+        """
+        if self.workers > 1:
+            return solve_puzzle_parallel(state, self.use_linear_conflict, self.use_pattern_db,
+                                         self.workers, self.weight)
+        return solve_puzzle(state, self.use_linear_conflict, self.use_pattern_db, self.weight)
+    
+    def _speculate(self, direction: Direction):
+        """
+        在后台预先求解对手下一步之后可能出现的局面
+        
+        对手走的如果正好是缓存路径上的下一步，不需要任何计算；
+        只有偏离路径的那几种走法（最多3种）提交给后台线程
+        
+        参数:
+            direction: 自己刚发出的移动
+        """
+        # 上一轮的预测已经用不上了，还没开始的直接取消
+        self._cancel_speculation()
+        
+        state = self.current_state.copy()
+        state.move(direction)
+        if state.is_goal():
+            return
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        
+        for reply in state.get_valid_moves():
+            predicted = state.copy()
+            predicted.move(reply)
+            key = predicted.to_tuple()
+            if key in self._plan_index or predicted.is_goal():
+                continue
+            # 预测总是在这一个后台线程里串行求解：不为每种走法各开一个进程池，
+            # 也能用abort随时中止
+            abort = threading.Event()
+            future = self._executor.submit(solve_puzzle, predicted, self.use_linear_conflict,
+                                           self.use_pattern_db, self.weight, abort)
+            self._speculative[key] = (future, abort)
+    
+    def _cancel_speculation(self):
+        """取消还没开始的预先求解、中止正在进行的，并丢弃所有预测结果"""
+        for future, abort in self._speculative.values():
+            future.cancel()
+            abort.set()
+        self._speculative = {}
+    
+    def _cache_plan(self, solution: List[Direction]):
+        """
+        缓存从当前状态出发的完整解法，并记录路径上每个状态的位置
+        
+        参数:
+            solution: 从current_state出发的移动序列
+        """
+        self.cached_plan = solution
+        self._plan_index = {}
+        state = self.current_state.copy()
+        for i, direction in enumerate(solution):
+            self._plan_index[state.to_tuple()] = i
+            state.move(direction)
+    
+    def _clear_plan(self):
+        """丢弃缓存的解法（游戏结束或换题时调用）"""
+        self.cached_plan = []
+        self._plan_index = {}
+        self._cancel_speculation()
     
     def _cleanup(self):
         """
@@ -258,6 +518,17 @@ class SolverNode:
         """
         self.running = False
         
+        if self._executor is not None:
+            # shutdown(cancel_futures=...)要Python 3.9，这里自己先取消
+            self._cancel_speculation()
+            self._executor.shutdown(wait=False)
+        
+        if self._selector is not None:
+            self._selector.close()
+        for sock in (self._wake_r, self._wake_w):
+            if sock is not None:
+                sock.close()
+        
         if self.socket:
             try:
                 self.socket.close()
@@ -269,6 +540,29 @@ class SolverNode:
 
 # ==================== 程序入口 ====================
 
+def _weight_arg(text: str) -> float:
+    """
+    解析 --weight 参数：必须是不小于1的有限数
+    
+    0、负数或NaN会让IDA*的阈值不再增长（或者永远不满足比较），
+    这里直接拒绝，由argparse报错退出
+    
+    参数:
+        text: 命令行上的原始字符串
+    
+    返回值:
+        权重
+    """
+    try:
+        weight = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"不是有效的数字: {text}")
+    # NaN和任何数比较都是False，所以这个区间判断也会把它拒绝
+    if not (1 <= weight < float('inf')):
+        raise argparse.ArgumentTypeError(f"必须是不小于1的有限数: {text}")
+    return weight
+
+
 def main():
     """
     主函数：程序入口点
@@ -309,6 +603,43 @@ def main():
         help='不使用线性冲突优化 (用于区分两个Solver的算法)'
     )
     
+    # 添加 --no-pattern-db 参数（可选），禁用模式数据库
+    parser.add_argument(
+        '--no-pattern-db', 
+        action='store_true',
+        help='不使用模式数据库 (首次使用时需要构建，4x4约半分钟)'
+    )
+    
+    # 添加 --no-speculate 参数（可选），关闭对手回合时的预先求解
+    parser.add_argument(
+        '--no-speculate', 
+        action='store_true',
+        help='不在对手回合时预先求解 (会少占用一些CPU)'
+    )
+    
+    # 添加 --workers 参数（可选），并行求解的进程数
+    parser.add_argument(
+        '--workers', 
+        type=int, 
+        default=1,
+        help='求解进程数，大于1时较难的题按第一步的方向多进程并行搜索 (默认: 1)'
+    )
+    
+    # 添加 --weight 参数（可选），加权搜索
+    parser.add_argument(
+        '--weight', 
+        type=_weight_arg, 
+        default=1.0,
+        help='启发值的权重 (>=1，默认1)。大于1时求解更快，但步数最多是最优解的weight倍'
+    )
+    
+    # 添加 --verbose 参数（可选），立即打印每一条日志
+    parser.add_argument(
+        '--verbose', 
+        action='store_true',
+        help='也打印每条消息的收发日志 (默认只打印连接、计算和结果，收发日志只在出错时打印)'
+    )
+    
     # 解析命令行参数
     args = parser.parse_args()
     
@@ -316,7 +647,12 @@ def main():
     print("=" * 50)
     print(f"  数字华容道 - Solver {args.id}")
     print(f"  目标: {args.host}:{args.port}")
-    print(f"  算法: {'曼哈顿距离' if args.no_linear_conflict else '线性冲突'}")
+    if args.no_pattern_db:
+        print(f"  算法: {'曼哈顿距离' if args.no_linear_conflict else '线性冲突'}")
+    else:
+        print(f"  算法: 模式数据库 (不支持的大小使用{'曼哈顿距离' if args.no_linear_conflict else '线性冲突'})")
+    if args.weight != 1:
+        print(f"  注意: 加权搜索 (weight={args.weight})，解不一定最短")
     print("=" * 50)
     print()
     
@@ -325,9 +661,17 @@ def main():
         solver_id=args.id,
         host=args.host,
         port=args.port,
-        use_linear_conflict=not args.no_linear_conflict  # 注意取反
+        use_linear_conflict=not args.no_linear_conflict,  # 注意取反
+        use_pattern_db=not args.no_pattern_db,
+        workers=args.workers,
+        speculate=not args.no_speculate,
+        verbose=args.verbose,
+        weight=args.weight
     )
     
+    # 被kill（SIGTERM）时和Ctrl+C一样正常退出：清理socket、打印缓存的日志
+    signal.signal(signal.SIGTERM, lambda signum, frame: solver.stop())
+    
     # 运行
     solver.run()
 
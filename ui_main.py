@@ -12,27 +12,95 @@
 import tkinter as tk                    # Python标准的GUI库，用于创建图形界面
 from tkinter import ttk, messagebox, filedialog  # ttk是主题化控件，messagebox用于弹窗，filedialog用于文件选择对话框
 import socket                           # 网络通信库，用于创建TCP服务器
+import selectors                        # I/O多路复用，一个线程同时等待所有连接
+import functools                        # partial，用于给处理函数绑定参数
 import threading                        # 多线程库，让网络通信在后台运行，不阻塞界面
-import time                             # 时间相关功能
+import time                             # 时间相关功能，也用于日志时间戳
 import os                               # 操作系统接口，用于文件路径处理
-from datetime import datetime           # 日期时间处理，用于日志时间戳
+from collections import deque           # 双端队列，用作待显示日志的队列
 from typing import Optional, Dict, List # 类型提示，让代码更易读（Python 3.5+特性）
 
+# watchdog是可选依赖：装了就用操作系统的文件变化通知监控puzzle.txt，没装就退回每秒轮询
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
 # 从我们自己的common模块导入需要的类和函数
 from common import (
     PuzzleState,           # 棋盘状态类
     Direction,             # 移动方向枚举
     Message,               # 网络消息类
     MessageType,           # 消息类型枚举
-    send_message,          # 发送消息的函数
-    recv_message,          # 接收消息的函数
+    encode_messages,       # 把消息编码成帧（交给网络线程发送）
+    MessageReader,         # 按帧读取消息（配合selector使用）
     is_solvable,           # 判断棋盘是否可解
     load_puzzle_from_file, # 从文件加载棋盘
     DEFAULT_PORT,          # 默认端口号
-    DIRECTION_DELTA        # 方向偏移量
+    DIRECTION_DELTA,       # 方向偏移量
+    unix_socket_path       # 本机Unix域套接字路径
 )
 
 
+# 待显示的日志攒够这么久（毫秒）再一起写进日志区域
+LOG_FLUSH_INTERVAL_MS = 50
+
+# 日志区域最多保留的行数，超出后删掉最早的日志
+LOG_MAX_LINES = 2000
+
+# puzzle.txt在这么久（毫秒）内不再变化，就认为已经写完，可以加载了
+PUZZLE_RELOAD_DELAY_MS = 100
+
+
+# ==================== 工具函数 ====================
+
+@functools.lru_cache(maxsize=1)
+def get_local_ip() -> str:
+    """
+    获取本机IP地址（结果缓存，只查询一次）
+    
+    gethostbyname要做名字解析，hosts配置不对时可能卡好几秒
+    
+    返回值:
+        IP地址字符串，获取失败时返回本地回环地址
+    """
+    try:
+        hostname = socket.gethostname()            # 获取计算机名
+        return socket.gethostbyname(hostname)      # 根据计算机名获取IP
+    except OSError:
+        return "127.0.0.1"                         # 获取失败则显示本地回环地址
+
+
+class _PuzzleFileHandler(FileSystemEventHandler):
+    """watchdog事件处理器：目标文件被创建、修改或改名覆盖时调用回调"""
+    
+    def __init__(self, path: str, callback):
+        """
+        参数:
+            path: 要监控的文件（绝对路径）
+            callback: 文件变化时调用的函数（在watchdog的线程中调用）
+        """
+        super().__init__()
+        self.path = path
+        self.callback = callback
+    
+    def on_created(self, event):
+        self._check(event.src_path)
+    
+    def on_modified(self, event):
+        self._check(event.src_path)
+    
+    def on_moved(self, event):
+        # 很多编辑器先写临时文件再改名覆盖原文件
+        self._check(event.dest_path)
+    
+    def _check(self, path: str):
+        if os.path.abspath(path) == self.path:
+            self.callback()
+
+
 # ==================== 主类定义 ====================
 class PuzzleUI:
     """
@@ -72,13 +140,23 @@ class PuzzleUI:
         # 当前棋盘状态，初始为None（还没加载题目）
         self.state: Optional[PuzzleState] = None
         
+        # 当前题目是否可解（加载时判断一次；合法移动不会改变可解性）
+        self.puzzle_solvable = False
+        
         # 当前步数计数器
         self.step_count = 0
         
+        # 是否已经安排了空闲时刷新棋盘和步数，以及刷新时是否高亮
+        self._board_refresh_pending = False
+        self._board_highlight = False
+        
         # 已连接的Solver字典，键是Solver ID(1或2)，值是socket连接
         # 例如: {1: <socket对象>, 2: <socket对象>}
         self.solver_connections: Dict[int, socket.socket] = {}
         
+        # 反向索引：socket -> Solver ID，连接断开时直接查到是哪个Solver
+        self._sock_to_sid: Dict[socket.socket, int] = {}
+        
         # 当前轮到哪个Solver（1或2），初始为1
         self.current_solver = 1
         
@@ -88,13 +166,48 @@ class PuzzleUI:
         # 服务器socket对象
         self.server_socket: Optional[socket.socket] = None
         
+        # 本机Unix域套接字（给同一台机器上的Solver用，可能没有）
+        self.unix_socket: Optional[socket.socket] = None
+        
+        # 网络线程使用的selector（在_start_server中创建）
+        self._selector: Optional[selectors.BaseSelector] = None
+        
+        # 网络线程及让它退出用的标志和唤醒socket对（写端发一个字节唤醒select）
+        self._network_thread: Optional[threading.Thread] = None
+        self._shutdown = threading.Event()
+        self._wake_r: Optional[socket.socket] = None
+        self._wake_w: Optional[socket.socket] = None
+        
+        # 主线程要发给Solver的数据 (socket, 编码好的字节串)，由网络线程取出发送
+        self._outgoing = deque()
+        
+        # 网络线程中每个连接暂时没写进去的数据（等socket可写时接着发）
+        self._unsent: Dict[socket.socket, bytearray] = {}
+        
+        # 网络线程交给主线程执行的回调 (函数, 参数)，以及是否已经安排了处理
+        self._tk_inbox = deque()
+        self._tk_inbox_pending = False
+        
         # 解法步骤列表（预留字段，当前未使用）
         self.solution_moves: List[Direction] = []
         
+        # 待写入日志区域的 (时间戳, 内容, 标签)，任何线程都可以追加
+        self._log_queue = deque()
+        self._log_flush_pending = False
+        
+        # (整秒时间, 格式化好的"时:分:秒")，同一秒内的日志直接复用
+        self._timestamp_cache = (0, "")
+        
+        # watchdog的监控器（没装watchdog时为None，改用轮询线程）
+        self._file_observer = None
+        
+        # 等待执行的puzzle.txt加载任务（root.after返回的ID）
+        self._reload_after_id = None
+        
         # 初始化UI界面（创建窗口和所有控件）
         self._init_ui()
         
-        # 启动TCP服务器（在后台线程）
+        # 启动TCP服务器（网络事件在后台线程处理）
         self._start_server()
         
         # 启动文件监控（自动检测puzzle.txt的变化）
@@ -210,6 +323,16 @@ class PuzzleUI:
         # 例如: [[Label00, Label01, Label02], [Label10, Label11, Label12], ...]
         self.tile_labels: List[List[tk.Label]] = []
         
+        # 创建过的所有格子控件（换棋盘大小时复用，不销毁）
+        self._tile_pool: List[tk.Label] = []
+        
+        # 每个格子当前显示的 (文字, 背景色)，没变化就不调用config
+        self._tile_shown: Dict[tk.Label, tuple] = {}
+        
+        # 上次刷新时的一维棋盘快照和是否高亮，用来找出这次变化的格子
+        self._prev_board: Optional[bytes] = None
+        self._prev_highlight = False
+        
         # 创建一个默认的3x3空棋盘
         self._create_empty_board(3)
         
@@ -237,33 +360,42 @@ class PuzzleUI:
         """
         创建空棋盘（或重新创建）
         
+        格子控件从self._tile_pool中复用，只有池里不够时才新建；
+        多出来的格子只是从布局中移除，留着下次再用
+        
         参数:
             size: 棋盘大小（3表示3x3，4表示4x4）
         """
-        # 先销毁旧的格子（如果有的话）
+        # 先把旧的格子从布局中移除（控件本身保留在池里）
         for row in self.tile_labels:
             for label in row:
-                label.destroy()  # 销毁控件，释放资源
+                label.grid_forget()
         self.tile_labels = []  # 清空列表
+        self._prev_board = None  # 格子全部清空了，下次刷新要重画所有格子
+        
+        # 池里的格子不够就补足
+        while len(self._tile_pool) < size * size:
+            # 每个格子是一个Label控件
+            label = tk.Label(
+                self.board_container,              # 父容器
+                text="",                           # 初始文字为空
+                font=('Arial', 28, 'bold'),
+                width=3,                           # 宽度（字符数）
+                height=1,                          # 高度（行数）
+                bg=self.COLORS['empty'],
+                fg=self.COLORS['tile_text'],
+                relief=tk.FLAT
+            )
+            self._tile_pool.append(label)
+            self._tile_shown[label] = ("", self.COLORS['empty'])
         
-        # 根据棋盘大小决定格子尺寸
-        tile_size = 80 if size <= 4 else 60
-        
-        # 嵌套循环创建size x size个格子
+        # 嵌套循环摆放size x size个格子
         for i in range(size):       # 行
             row_labels = []
             for j in range(size):   # 列
-                # 每个格子是一个Label控件
-                label = tk.Label(
-                    self.board_container,              # 父容器
-                    text="",                           # 初始文字为空
-                    font=('Arial', 28, 'bold'),
-                    width=3,                           # 宽度（字符数）
-                    height=1,                          # 高度（行数）
-                    bg=self.COLORS['empty'],
-                    fg=self.COLORS['tile_text'],
-                    relief=tk.FLAT
-                )
+                label = self._tile_pool[i * size + j]
+                # 复用的格子可能还显示着上一局的数字，先清空
+                self._set_tile(label, "", self.COLORS['empty'])
                 # 使用grid布局，按行列放置
                 label.grid(row=i, column=j, padx=3, pady=3)
                 row_labels.append(label)
@@ -332,9 +464,14 @@ class PuzzleUI:
             bg='#0a1628',                          # 深色背景
             fg=self.COLORS['log_text'],
             relief=tk.FLAT,
-            wrap=tk.WORD,                          # 按单词换行
+            wrap=tk.NONE,                          # 不自动换行（插入时不用重新排版），长行横向滚动查看
             state=tk.DISABLED                      # 初始禁用编辑
         )
+        
+        # 横向滚动条（先放在底部，再让文本框占满剩余空间）
+        log_xscroll = tk.Scrollbar(log_frame, orient=tk.HORIZONTAL, command=self.log_text.xview)
+        self.log_text.config(xscrollcommand=log_xscroll.set)
+        log_xscroll.pack(side=tk.BOTTOM, fill=tk.X)
         self.log_text.pack(fill=tk.BOTH, expand=True)
         
         # 配置文本标签（tag）的颜色
@@ -366,17 +503,10 @@ class PuzzleUI:
         )
         self.status_label.pack(side=tk.LEFT)
         
-        # 获取本机IP地址
-        try:
-            hostname = socket.gethostname()            # 获取计算机名
-            ip = socket.gethostbyname(hostname)        # 根据计算机名获取IP
-        except:
-            ip = "127.0.0.1"                           # 获取失败则显示本地回环地址
-        
-        # IP地址标签（右边）
+        # IP地址标签（右边），先显示占位文字
         ip_label = tk.Label(
             status_frame,
-            text=f"IP: {ip}:{self.port}",              # f-string格式化
+            text=f"IP: ...:{self.port}",               # f-string格式化
             font=('Consolas', 10),
             fg=self.COLORS['accent'],
             bg=self.COLORS['tile'],
@@ -384,30 +514,64 @@ class PuzzleUI:
             pady=5
         )
         ip_label.pack(side=tk.RIGHT)
+        
+        # 本机IP在后台线程里获取（可能要等名字解析），拿到后再回主线程更新标签，
+        # 这样窗口不用等它就能显示出来
+        def resolve_ip():
+            ip = get_local_ip()
+            self.root.after(0, functools.partial(ip_label.config, text=f"IP: {ip}:{self.port}"))
+        
+        threading.Thread(target=resolve_ip, daemon=True).start()
     
     # ==================== 工具方法 ====================
     
     def _log(self, message: str, tag: str = None):
         """
-        添加一条日志到日志区域
+        添加一条日志到日志区域（可以在任何线程中调用）
+        
+        日志先放进队列，最多LOG_FLUSH_INTERVAL_MS毫秒后由主线程一次性写入，
+        连续很多条日志时只需要一轮Text控件操作
         
         参数:
             message: 日志内容
             tag: 文本标签（决定颜色），如'solver1', 'error', 'success'
         """
-        # 获取当前时间，格式化为 时:分:秒
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        # 获取当前时间，格式化为 时:分:秒（每秒只格式化一次）
+        now = int(time.time())
+        second, timestamp = self._timestamp_cache
+        if second != now:
+            timestamp = time.strftime("%H:%M:%S", time.localtime(now))
+            self._timestamp_cache = (now, timestamp)
+        
+        self._log_queue.append((timestamp, message, tag))
+        
+        # 已经安排过写入就不再重复安排
+        if not self._log_flush_pending:
+            self._log_flush_pending = True
+            self.root.after(LOG_FLUSH_INTERVAL_MS, self._flush_log_queue)
+    
+    def _flush_log_queue(self):
+        """把队列里的日志一次性写入日志区域（在主线程执行）"""
+        # 先清标志再取日志：取的过程中新来的日志会重新安排一次写入
+        self._log_flush_pending = False
         
         # Text控件默认是DISABLED状态（只读），需要先启用才能写入
         self.log_text.config(state=tk.NORMAL)
         
-        if tag:
-            # 有标签时，时间戳用灰色，内容用标签指定的颜色
-            self.log_text.insert(tk.END, f"[{timestamp}] ", 'info')
-            self.log_text.insert(tk.END, f"{message}\n", tag)
-        else:
-            # 没有标签时，全部用默认颜色
-            self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        while self._log_queue:
+            timestamp, message, tag = self._log_queue.popleft()
+            if tag:
+                # 有标签时，时间戳用灰色，内容用标签指定的颜色
+                self.log_text.insert(tk.END, f"[{timestamp}] ", 'info', f"{message}\n", tag)
+            else:
+                # 没有标签时，全部用默认颜色
+                self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        
+        # 每行日志都以换行结尾，最后一个字符前的位置在第(行数+1)行
+        line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+        if line_count > LOG_MAX_LINES:
+            # 只保留最新的LOG_MAX_LINES行
+            self.log_text.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')
         
         # 自动滚动到最新内容
         self.log_text.see(tk.END)
@@ -415,10 +579,42 @@ class PuzzleUI:
         # 写入完成后重新禁用编辑
         self.log_text.config(state=tk.DISABLED)
     
+    def _call_in_tk(self, func, *args):
+        """
+        让主线程执行func(*args)（可以在任何线程中调用）
+        
+        回调先放进队列，主线程一次处理掉队列里的所有回调；
+        连续到达的多条消息只需要一次root.after跨线程调用
+        
+        参数:
+            func: 要在主线程执行的函数
+            args: 传给func的参数
+        """
+        self._tk_inbox.append((func, args))
+        
+        # 已经安排过处理就不再重复安排
+        if not self._tk_inbox_pending:
+            self._tk_inbox_pending = True
+            self.root.after(0, self._drain_tk_inbox)
+    
+    def _drain_tk_inbox(self):
+        """依次执行队列里的回调（在主线程执行）"""
+        # 先清标志再取回调：取的过程中新来的回调会重新安排一次处理
+        self._tk_inbox_pending = False
+        
+        while self._tk_inbox:
+            func, args = self._tk_inbox.popleft()
+            # 一个回调出错（例如一条坏的MOVE）不能让后面的回调一直卡在队列里
+            try:
+                func(*args)
+            except Exception as e:
+                self._log(f"处理网络事件出错: {str(e)}", 'error')
+    
     def _update_board(self, highlight_success: bool = False):
         """
         更新棋盘显示
-        根据self.state的内容刷新所有格子
+        根据self.state的内容刷新格子，只处理和上次刷新相比变化了的格子
+        （每走一步只有空位和被移动的数字两个格子会变）
         
         参数:
             highlight_success: 是否用绿色高亮显示（游戏完成时）
@@ -432,31 +628,79 @@ class PuzzleUI:
         if len(self.tile_labels) != size:
             self._create_empty_board(size)
         
-        # 遍历棋盘的每个位置
-        for i in range(size):
-            for j in range(size):
-                val = self.state.board[i][j]       # 获取这个位置的数字
-                label = self.tile_labels[i][j]     # 获取对应的Label控件
-                
-                if val == 0:
-                    # 空位：不显示文字，用深色背景
-                    label.config(
-                        text="",
-                        bg=self.COLORS['empty']
-                    )
-                else:
-                    # 有数字：显示数字，根据参数决定背景色
-                    bg_color = self.COLORS['success'] if highlight_success else self.COLORS['tile']
-                    label.config(
-                        text=str(val),
-                        bg=bg_color,
-                        fg=self.COLORS['tile_text']
-                    )
+        # 拷贝一份一维棋盘作为快照（flat是状态内部的数组，之后会被修改）
+        flat = bytes(self.state.flat)
+        prev = self._prev_board
+        
+        if prev is None or highlight_success != self._prev_highlight:
+            # 第一次刷新或高亮状态变了，所有格子都要处理
+            changed = range(size * size)
+        elif prev == flat:
+            return  # 棋盘没有变化
+        else:
+            changed = [k for k in range(size * size) if prev[k] != flat[k]]
+        
+        # 循环里用到的颜色、控件表和方法先取到局部变量
+        bg_color = self.COLORS['success'] if highlight_success else self.COLORS['tile']
+        bg_empty = self.COLORS['empty']
+        tile_labels = self.tile_labels
+        set_tile = self._set_tile
+        
+        # 遍历变化了的位置
+        for k in changed:
+            val = flat[k]                                   # 获取这个位置的数字
+            label = tile_labels[k // size][k % size]        # 获取对应的Label控件
+            
+            if val == 0:
+                # 空位：不显示文字，用深色背景
+                set_tile(label, "", bg_empty)
+            else:
+                # 有数字：显示数字，根据参数决定背景色
+                set_tile(label, str(val), bg_color)
+        
+        self._prev_board = flat
+        self._prev_highlight = highlight_success
+    
+    def _set_tile(self, label: tk.Label, text: str, bg: str):
+        """
+        设置一个格子的文字和背景色，和当前显示的一样时什么都不做
+        
+        参数:
+            label: 格子控件
+            text: 要显示的文字
+            bg: 背景色
+        """
+        shown = (text, bg)
+        if self._tile_shown.get(label) != shown:
+            # 直接调用Tcl的configure命令（str(label)是控件的Tcl路径名），
+            # 跳过Label.config里合并、转换选项字典的那一层
+            label.tk.call(str(label), 'configure', '-text', text, '-bg', bg)
+            self._tile_shown[label] = shown
     
     def _update_step_count(self):
         """更新步数显示"""
         self.step_label.config(text=f"步数: {self.step_count}")
     
+    def _schedule_board_refresh(self, highlight_success: bool = False):
+        """
+        安排在Tk空闲时刷新棋盘和步数
+        
+        连续到达的多步移动只在空闲时刷新一次，中间状态不会被画出来
+        
+        参数:
+            highlight_success: 刷新时是否用绿色高亮显示（以最后一次调用为准）
+        """
+        self._board_highlight = highlight_success
+        if not self._board_refresh_pending:
+            self._board_refresh_pending = True
+            self.root.after_idle(self._refresh_board_view)
+    
+    def _refresh_board_view(self):
+        """执行安排好的棋盘和步数刷新"""
+        self._board_refresh_pending = False
+        self._update_board(highlight_success=self._board_highlight)
+        self._update_step_count()
+    
     def _set_status(self, text: str):
         """设置底部状态栏的文字"""
         self.status_label.config(text=text)
@@ -493,17 +737,17 @@ class PuzzleUI:
             
             # 从文件加载棋盘状态（调用common模块的函数）
             self.state = load_puzzle_from_file(filepath)
+            self.puzzle_solvable = is_solvable(self.state)
             
             # 更新UI
-            self._update_board()
-            self._update_step_count()
+            self._schedule_board_refresh()
             
             # 获取文件名（不含路径）
             filename = os.path.basename(filepath)
             self._log(f"已加载题目: {filename}", 'info')
             
             # 检查题目是否可解
-            if is_solvable(self.state):
+            if self.puzzle_solvable:
                 self._log("题目可解 ✓", 'success')
                 self._set_status(f"已加载 {filename} ({self.state.size}x{self.state.size})")
                 
@@ -526,10 +770,15 @@ class PuzzleUI:
     def _start_server(self):
         """
         启动TCP服务器
-        在后台线程中运行，避免阻塞UI
+        
+        监听socket和每个Solver的连接都注册到同一个selector上，由一个后台线程
+        统一等待：哪个socket可读就调用它注册时附带的处理函数。
+        不再为每个Solver单独开一个阻塞在recv上的线程
         """
-        def server_thread():
-            """服务器线程的主函数"""
+        # 所有socket共用的selector（data字段存放可读时要调用的处理函数）
+        self._selector = selectors.DefaultSelector()
+        
+        try:
             # 创建TCP socket
             # AF_INET表示使用IPv4
             # SOCK_STREAM表示使用TCP协议
@@ -544,115 +793,308 @@ class PuzzleUI:
             
             # 开始监听，参数2表示最多允许2个等待连接
             self.server_socket.listen(2)
-            
-            # 记录日志（注意：这是在后台线程，但_log方法内部会处理线程安全）
-            self._log(f"服务器启动，监听端口 {self.port}", 'info')
-            
-            # 无限循环等待连接
-            while True:
-                try:
-                    # accept()会阻塞，直到有客户端连接
-                    # 返回值：(客户端socket, 客户端地址)
-                    client_socket, addr = self.server_socket.accept()
-                    
-                    # 为每个客户端连接创建一个新的线程处理
-                    # daemon=True表示这是守护线程，主程序退出时会自动结束
-                    threading.Thread(
-                        target=self._handle_client,
-                        args=(client_socket, addr),
-                        daemon=True
-                    ).start()
-                except Exception as e:
-                    if self.server_socket:
-                        self._log(f"服务器错误: {str(e)}", 'error')
-                    break
-        
-        # 创建并启动服务器线程
-        threading.Thread(target=server_thread, daemon=True).start()
-    
-    def _handle_client(self, client_socket: socket.socket, addr):
-        """
-        处理一个客户端（Solver）的连接
+        except OSError as e:
+            self._log(f"服务器启动失败: {str(e)}", 'error')
+            return
+        
+        self._selector.register(self.server_socket, selectors.EVENT_READ, self._accept_client)
+        self._log(f"服务器启动，监听端口 {self.port}", 'info')
+        
+        # 同一台机器上的Solver可以改走Unix域套接字（注册到同一个selector）
+        self._start_unix_server()
+        
+        # 窗口关闭时通过它唤醒网络线程，让它自己退出并关闭所有socket
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_w.setblocking(False)  # 唤醒信号攒满了也不能卡住主线程
+        self._selector.register(self._wake_r, selectors.EVENT_READ, self._on_wake)
+        
+        # 创建并启动网络线程
+        self._network_thread = threading.Thread(target=self._network_loop, daemon=True)
+        self._network_thread.start()
+    
+    def _start_unix_server(self):
+        """
+        额外在本机的Unix域套接字上监听（系统不支持或创建失败时只用TCP）
+        """
+        if not hasattr(socket, 'AF_UNIX'):
+            return
+        
+        try:
+            path = unix_socket_path(self.port)
+            # 上次运行留下的套接字文件会让bind失败，先删掉
+            if os.path.exists(path):
+                os.unlink(path)
+            unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            unix_socket.bind(path)
+            unix_socket.listen(2)
+        except OSError as e:
+            self._log(f"本机套接字不可用，只使用TCP: {str(e)}", 'info')
+            return
+        
+        self.unix_socket = unix_socket
+        self._selector.register(unix_socket, selectors.EVENT_READ, self._accept_client)
+    
+    def _network_loop(self):
+        """
+        网络线程的主函数：等待任意socket可读（或可写），交给对应的处理函数
+        
+        所有socket的读写都在这个线程里进行，主线程只通过_post交出要发送的数据
+        """
+        try:
+            while not self._shutdown.is_set():
+                for key, events in self._selector.select():
+                    sock = key.fileobj
+                    try:
+                        if events & selectors.EVENT_WRITE:
+                            self._flush_unsent(sock)
+                        # 写的时候可能发现连接断开，socket已经被关闭
+                        if events & selectors.EVENT_READ and sock.fileno() != -1:
+                            key.data(sock)
+                    except Exception as e:
+                        self._log(f"连接处理错误: {str(e)}", 'error')
+                        if key.fileobj not in (self.server_socket, self.unix_socket):
+                            self._drop_client(key.fileobj)
+        finally:
+            # 关闭还注册着的所有socket（监听socket、Solver连接、唤醒socket）
+            for key in list(self._selector.get_map().values()):
+                key.fileobj.close()
+            self._selector.close()
+            self._wake_w.close()
+    
+    def _on_wake(self, wake_socket: socket.socket):
+        """
+        唤醒socket可读：读掉唤醒信号，发送主线程交过来的数据
+        （退出时被唤醒的话，循环条件会检查退出标志）
+        """
+        wake_socket.recv(4096)
+        while self._outgoing:
+            sock, data = self._outgoing.popleft()
+            self._write(sock, data)
+    
+    def _post(self, sock: socket.socket, data: bytes):
+        """
+        把数据交给网络线程发送（在主线程调用，不会阻塞）
+        
+        Solver来不及接收、socket缓冲区满了的时候，界面也不会卡住
+        
+        参数:
+            sock: 目标Solver的socket
+            data: encode_messages编码好的数据
+        """
+        self._outgoing.append((sock, data))
+        try:
+            self._wake_w.send(b'x')
+        except OSError:
+            pass  # 唤醒信号已经攒满（网络线程反正会醒），或者网络线程已经退出
+    
+    def _write(self, sock: socket.socket, data: bytes):
+        """
+        发送数据（在网络线程调用）：一次写不完的部分留到socket可写时再发
+        
+        参数:
+            sock: 目标socket（非阻塞）
+            data: 要发送的数据
+        """
+        if sock.fileno() == -1:
+            return  # 连接已经断开并关闭了
+        
+        pending = self._unsent.get(sock)
+        if pending:
+            pending += data  # 前面还有没发完的数据，排在它后面
+            return
+        
+        try:
+            sent = sock.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._drop_client(sock)
+            return
+        
+        if sent < len(data):
+            # 剩下的等socket可写时再发（读的处理函数保持不变）
+            self._unsent[sock] = bytearray(data[sent:])
+            handler = self._selector.get_key(sock).data
+            self._selector.modify(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, handler)
+    
+    def _flush_unsent(self, sock: socket.socket):
+        """
+        socket可写：继续发送之前没写完的数据（在网络线程调用）
+        
+        参数:
+            sock: 可写的socket
+        """
+        pending = self._unsent[sock]
+        try:
+            sent = sock.send(pending)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop_client(sock)
+            return
+        
+        del pending[:sent]
+        if not pending:
+            # 全部发完，不再关心可写事件
+            del self._unsent[sock]
+            handler = self._selector.get_key(sock).data
+            self._selector.modify(sock, selectors.EVENT_READ, handler)
+    
+    def _stop_server(self):
+        """
+        让网络线程退出并等它关闭所有socket（在主线程调用）
+        """
+        if self._network_thread is None:
+            return  # 服务器没有启动成功
+        
+        self._shutdown.set()
+        try:
+            self._wake_w.send(b'x')
+        except OSError:
+            pass  # 网络线程已经退出并关闭了唤醒socket
+        self._network_thread.join(timeout=2)
+    
+    def _accept_client(self, server_socket: socket.socket):
+        """
+        监听socket可读：接受一个新连接，等它发来连接请求
+        
+        参数:
+            server_socket: 可读的监听socket（TCP或Unix域）
+        """
+        # 返回值：(客户端socket, 客户端地址)
+        client_socket, addr = server_socket.accept()
+        
+        # 非阻塞：网络线程读写任何一个连接都不能卡住其他连接
+        client_socket.setblocking(False)
+        
+        if server_socket.family == socket.AF_INET:
+            # 关闭Nagle算法：STATE/YOUR_TURN都是很小的控制消息，要立即发出
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            # 开启TCP保活，Solver所在机器断网时连接最终会报错而不是一直挂着
+            client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        else:
+            # Unix域套接字的地址是空字符串，换成和TCP一样的(主机, 端口)形式显示
+            addr = ('localhost', 'unix')
+        
+        # 这个连接的第一条消息应该是CONNECT
+        # 网络线程要同时照顾所有连接，不能阻塞在某一条没收完的消息上，
+        # 所以每个连接配一个MessageReader，凑齐一条再处理
+        self._selector.register(
+            client_socket, selectors.EVENT_READ,
+            functools.partial(self._handle_client, reader=MessageReader(client_socket), addr=addr)
+        )
+    
+    def _handle_client(self, client_socket: socket.socket, reader: MessageReader, addr):
+        """
+        处理一个客户端（Solver）的连接请求（连接上的第一条消息）
         
         参数:
             client_socket: 客户端的socket对象
+            reader: 这个连接的消息读取器
             addr: 客户端的地址 (IP, 端口)
         """
-        try:
-            # 等待客户端发送连接请求消息
-            msg = recv_message(client_socket)
-            
-            # 检查是否是CONNECT类型的消息
-            if msg and msg.msg_type == MessageType.CONNECT:
-                solver_id = msg.solver_id  # 获取Solver的ID（1或2）
-                
-                # 验证ID是否有效
-                if solver_id in [1, 2]:
-                    # 保存这个连接
-                    self.solver_connections[solver_id] = client_socket
-                    
-                    # 更新UI（必须通过root.after()在主线程执行）
-                    # lambda是匿名函数，用于捕获当前的变量值
-                    self.root.after(0, lambda: self._update_solver_status(solver_id, True, addr[0]))
-                    self.root.after(0, lambda: self._log(
-                        f"Solver {solver_id} 已连接 ({addr[0]}:{addr[1]})",
-                        f'solver{solver_id}'
-                    ))
-                    
-                    # 发送欢迎消息给客户端
-                    welcome = Message(msg_type=MessageType.WELCOME, solver_id=solver_id)
-                    send_message(client_socket, welcome)
-                    
-                    # 检查是否两个Solver都连接了，且题目已加载且可解
-                    if len(self.solver_connections) == 2 and self.state and is_solvable(self.state):
-                        # 延迟100毫秒后开始游戏
-                        self.root.after(100, self._start_game)
-                    
-                    # 进入消息处理循环
-                    self._handle_solver_messages(client_socket, solver_id)
-                else:
-                    self._log(f"无效的Solver ID: {solver_id}", 'error')
+        messages = reader.read_messages()
+        if messages is None:
+            self._drop_client(client_socket)  # 连接已断开
+            return
+        if not messages:
+            return  # 连接请求还没收齐
         
-        except Exception as e:
-            self._log(f"连接处理错误: {str(e)}", 'error')
+        # 检查是否是CONNECT类型的消息
+        msg = messages[0]
+        if msg.msg_type != MessageType.CONNECT:
+            self._drop_client(client_socket)
+            return
         
-        finally:
-            # 无论如何，最后都要清理连接
-            # 从连接字典中移除
-            for sid, sock in list(self.solver_connections.items()):
-                if sock == client_socket:
-                    del self.solver_connections[sid]
-                    # 更新UI显示为断开状态
-                    self.root.after(0, lambda s=sid: self._update_solver_status(s, False, None))
-                    self.root.after(0, lambda s=sid: self._log(f"Solver {s} 已断开", 'error'))
-                    break
-            # 关闭socket
-            client_socket.close()
-    
-    def _handle_solver_messages(self, client_socket: socket.socket, solver_id: int):
-        """
-        持续接收Solver发来的消息
+        solver_id = msg.solver_id  # 获取Solver的ID（1或2）
+        
+        # 验证ID是否有效
+        if solver_id not in [1, 2]:
+            self._log(f"无效的Solver ID: {solver_id}", 'error')
+            self._drop_client(client_socket)
+            return
+        
+        # 保存这个连接
+        self.solver_connections[solver_id] = client_socket
+        self._sock_to_sid[client_socket] = solver_id
+        
+        # 更新UI（必须在主线程执行）
+        self._call_in_tk(self._update_solver_status, solver_id, True, addr[0])
+        self._log(f"Solver {solver_id} 已连接 ({addr[0]}:{addr[1]})", f'solver{solver_id}')
+        
+        # 之后这个连接上的消息都是这个Solver的指令
+        self._selector.modify(
+            client_socket, selectors.EVENT_READ,
+            functools.partial(self._handle_solver_message, reader=reader)
+        )
+        
+        # 发送欢迎消息给客户端
+        welcome = Message(msg_type=MessageType.WELCOME, solver_id=solver_id)
+        self._write(client_socket, encode_messages((welcome,)))
+        
+        # 两个Solver都连接了：延迟100毫秒后到主线程检查题目再开始游戏
+        # （self.state由主线程加载和修改，不在网络线程里读它；
+        # 延迟也由主线程安排，网络线程不直接调用root.after）
+        if len(self.solver_connections) == 2:
+            self._call_in_tk(self.root.after, 100, self._try_start_game)
+        
+        # 和连接请求一起到达的消息
+        self._dispatch_solver_messages(messages[1:])
+    
+    def _handle_solver_message(self, client_socket: socket.socket, reader: MessageReader):
+        """
+        接收Solver发来的消息（已经完成连接的socket可读时调用）
         
         参数:
             client_socket: 客户端socket
-            solver_id: Solver的ID
+            reader: 这个连接的消息读取器
         """
-        while True:
-            try:
-                # 接收消息（会阻塞直到收到消息）
-                msg = recv_message(client_socket)
-                
-                if not msg:
-                    break  # 连接已断开
-                
-                # 如果是移动指令
-                if msg.msg_type == MessageType.MOVE:
-                    # 通过root.after()在主线程处理
-                    # lambda m=msg 是为了"捕获"当前的msg值
-                    self.root.after(0, lambda m=msg: self._process_move(m))
-            
-            except Exception as e:
-                break  # 出错则退出循环
+        messages = reader.read_messages()
+        
+        if messages is None:
+            self._drop_client(client_socket)  # 连接已断开
+            return
+        
+        self._dispatch_solver_messages(messages)
+    
+    def _dispatch_solver_messages(self, messages: List[Message]):
+        """
+        把Solver的指令交给主线程处理
+        
+        参数:
+            messages: 收到的完整消息
+        """
+        for msg in messages:
+            # 如果是移动指令
+            if msg.msg_type == MessageType.MOVE:
+                # 交给主线程处理（msg作为参数传给_process_move）
+                self._call_in_tk(self._process_move, msg)
+    
+    def _drop_client(self, client_socket: socket.socket):
+        """
+        清理一个断开（或被拒绝）的连接
+        
+        参数:
+            client_socket: 客户端socket
+        """
+        try:
+            self._selector.unregister(client_socket)
+        except (KeyError, ValueError):
+            pass  # 已经注销过了
+        
+        # 没发完的数据也不用再发了
+        self._unsent.pop(client_socket, None)
+        
+        # 从连接字典中移除
+        sid = self._sock_to_sid.pop(client_socket, None)
+        # 同一个ID重新连接过的话，字典里已经是新连接了，不能删
+        if sid is not None and self.solver_connections.get(sid) is client_socket:
+            del self.solver_connections[sid]
+            # 更新UI显示为断开状态
+            self._call_in_tk(self._update_solver_status, sid, False, None)
+            self._log(f"Solver {sid} 已断开", 'error')
+        # 关闭socket
+        client_socket.close()
     
     # ==================== 游戏逻辑 ====================
     
@@ -679,8 +1121,7 @@ class PuzzleUI:
         if self.state.move(direction):
             # 移动成功
             self.step_count += 1
-            self._update_board()
-            self._update_step_count()
+            self._schedule_board_refresh()
             
             # 记录日志
             self._log(
@@ -724,6 +1165,11 @@ class PuzzleUI:
         # 更新标签
         label.config(text=text, fg=color)
     
+    def _try_start_game(self):
+        """两个Solver都已连接时调用：题目已加载且可解就开始游戏"""
+        if len(self.solver_connections) == 2 and self.state and self.puzzle_solvable:
+            self._start_game()
+    
     def _start_game(self):
         """开始游戏"""
         # 防止重复开始
@@ -741,31 +1187,31 @@ class PuzzleUI:
     def _notify_next_solver(self):
         """
         通知下一个Solver该它行动了
-        发送当前棋盘状态和YOUR_TURN消息
+        把当前棋盘状态和YOUR_TURN消息一次发送出去
         """
-        # 检查该Solver是否还在线
-        if self.current_solver not in self.solver_connections:
+        # 获取对应的socket，同时检查该Solver是否还在线
+        # （只查一次字典：网络线程随时可能删掉断开的连接）
+        sock = self.solver_connections.get(self.current_solver)
+        if sock is None:
             self._log(f"Solver {self.current_solver} 未连接，游戏中止", 'error')
             self.game_running = False
             return
         
-        # 获取对应的socket
-        sock = self.solver_connections[self.current_solver]
-        
-        # 发送当前棋盘状态
+        # 当前棋盘状态
         state_msg = Message(
             msg_type=MessageType.STATE,
             step_num=self.step_count,
-            board_data=self.state.board  # 发送二维数组
+            board_flat=bytes(self.state.flat)  # 直接发送一维棋盘，不用先拼成二维列表
         )
-        send_message(sock, state_msg)
         
-        # 发送"轮到你了"的通知
+        # "轮到你了"的通知
         turn_msg = Message(
             msg_type=MessageType.YOUR_TURN,
             solver_id=self.current_solver
         )
-        send_message(sock, turn_msg)
+        
+        # 两条消息合在一起交给网络线程发送（Solver端照常按顺序逐条处理）
+        self._post(sock, encode_messages((state_msg, turn_msg)))
     
     def _game_complete(self):
         """游戏完成的处理"""
@@ -776,7 +1222,7 @@ class PuzzleUI:
         self._set_status(f"游戏完成！总步数: {self.step_count} - 可加载新题目继续")
         
         # 用绿色高亮显示棋盘
-        self._update_board(highlight_success=True)
+        self._schedule_board_refresh(highlight_success=True)
         
         # 广播完成消息给所有Solver
         complete_msg = Message(
@@ -797,26 +1243,52 @@ class PuzzleUI:
         参数:
             msg: 要发送的消息
         """
-        for solver_id, sock in self.solver_connections.items():
-            try:
-                send_message(sock, msg)
-            except:
-                pass  # 发送失败就忽略
+        # 只编码一次，同样的字节发给每个Solver
+        data = encode_messages((msg,))
+        
+        # 交给网络线程发送，发送失败时由网络线程断开那个连接
+        # 网络线程随时可能增删连接，所以遍历一份快照
+        for sock in tuple(self.solver_connections.values()):
+            self._post(sock, data)
     
     # ==================== 文件监控 ====================
     
     def _start_file_watcher(self):
         """
-        启动文件监控线程
+        启动文件监控
         自动检测puzzle.txt文件的变化并加载
+        
+        装了watchdog时由操作系统通知文件变化，平时没有任何唤醒；
+        否则启动一个线程每秒检查一次文件的修改时间
         """
+        # 构建要监控的文件路径
+        puzzle_file = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "puzzle.txt"
+        )
+        
+        if Observer is not None:
+            handler = _PuzzleFileHandler(
+                puzzle_file,
+                functools.partial(self.root.after, 0, self._schedule_puzzle_reload, puzzle_file)
+            )
+            observer = Observer()
+            observer.daemon = True
+            try:
+                observer.schedule(handler, os.path.dirname(puzzle_file), recursive=False)
+                observer.start()
+            except OSError as e:
+                # 例如inotify监控数达到系统上限，退回轮询
+                self._log(f"文件监控启动失败，改为轮询: {e}", 'error')
+            else:
+                self._file_observer = observer
+                # 启动前就已存在的文件也加载一次（和轮询的行为一致）
+                if os.path.exists(puzzle_file):
+                    self._schedule_puzzle_reload(puzzle_file)
+                return
+        
         def watch():
             """监控线程的主函数"""
-            # 构建要监控的文件路径
-            puzzle_file = os.path.join(
-                os.path.dirname(os.path.abspath(__file__)),
-                "puzzle.txt"
-            )
             last_mtime = 0  # 上次的修改时间
             
             while True:
@@ -828,11 +1300,16 @@ class PuzzleUI:
                         
                         # 如果修改时间变了，说明文件被更新了
                         if mtime > last_mtime:
+                            # 等到修改时间在PUZZLE_RELOAD_DELAY_MS内不再变化，确保文件写入完成
+                            while True:
+                                time.sleep(PUZZLE_RELOAD_DELAY_MS / 1000)
+                                newer = os.path.getmtime(puzzle_file)
+                                if newer == mtime:
+                                    break
+                                mtime = newer
                             last_mtime = mtime
-                            # 等待0.5秒，确保文件写入完成
-                            time.sleep(0.5)
                             # 在主线程加载文件
-                            self.root.after(0, lambda: self._load_puzzle(puzzle_file))
+                            self.root.after(0, self._load_puzzle, puzzle_file)
                 except:
                     pass  # 忽略任何错误
                 
@@ -842,6 +1319,33 @@ class PuzzleUI:
         # 启动监控线程
         threading.Thread(target=watch, daemon=True).start()
     
+    def _schedule_puzzle_reload(self, puzzle_file: str):
+        """
+        安排稍后加载题目文件（在主线程调用）
+        
+        一次保存往往触发好几个事件，这里只保留最后一次的加载任务
+        
+        参数:
+            puzzle_file: 题目文件路径
+        """
+        if self._reload_after_id is not None:
+            self.root.after_cancel(self._reload_after_id)
+        self._reload_after_id = self.root.after(
+            PUZZLE_RELOAD_DELAY_MS, self._reload_puzzle, puzzle_file
+        )
+    
+    def _reload_puzzle(self, puzzle_file: str):
+        """
+        加载监控到变化的题目文件（在主线程调用）
+        
+        参数:
+            puzzle_file: 题目文件路径
+        """
+        self._reload_after_id = None
+        # 文件可能只是被删除或改名走了
+        if os.path.exists(puzzle_file):
+            self._load_puzzle(puzzle_file)
+    
     # ==================== 主循环 ====================
     
     def run(self):
@@ -852,6 +1356,19 @@ class PuzzleUI:
         # mainloop()会阻塞在这里，直到窗口关闭
         # 它持续处理用户输入、刷新界面等
         self.root.mainloop()
+        
+        if self._file_observer:
+            self._file_observer.stop()
+        
+        # 关闭所有连接，Solver会收到连接断开
+        self._stop_server()
+        
+        # 窗口关闭后删掉本机套接字文件
+        if self.unix_socket:
+            try:
+                os.unlink(unix_socket_path(self.port))
+            except OSError:
+                pass
 
 
 # ==================== 程序入口 ====================